@@ -24,20 +24,86 @@ This module provides the admin settings of the privacy_policy_tools.
 """
 
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 from modeltranslation.admin import TranslationAdmin
 
+from privacy_policy_tools.campaigns import get_progress
 from privacy_policy_tools.models import PrivacyPolicy, \
-    PrivacyPolicyConfirmation
+    PrivacyPolicyConfirmation, PrivacyPolicyStatistics, ConsentCampaign, \
+    OutgoingMail
+
+
+def get_user_search_fields():
+    """
+    Returns exact lookups on the username and the e-mail of the user, so
+    that the indexes of the user table can be used.
+    """
+    user_model = get_user_model()
+    fields = ['user__%s__exact' % user_model.USERNAME_FIELD]
+    email_field = user_model.get_email_field_name()
+    if email_field != user_model.USERNAME_FIELD:
+        try:
+            user_model._meta.get_field(email_field)
+            fields.append('user__%s__exact' % email_field)
+        except FieldDoesNotExist:
+            pass
+    return fields
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which uses the estimated number of rows of the table on
+    PostgreSQL if the list is not filtered. Otherwise the rows are counted.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self._estimate(self.object_list)
+            if estimate is not None:
+                return estimate
+        return super().count
+
+    def _estimate(self, queryset):
+        """
+        Returns the estimated number of rows of the table or None.
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] < 10000:
+            return None
+        return int(row[0])
 
 
 class PrivacyPolicyConfirmationAdmin(admin.ModelAdmin):
     """
-    View confirmations to privacy policies.
+    View confirmations to privacy policies. The list is built for large
+    tables: related objects are selected in the same query, users are
+    searched by exact username or e-mail and the rows are not counted
+    on every page.
     """
     list_display = ('user', 'privacy_policy',
                     'confirmed_at', 'second_confirmed_at')
     list_filter = ['privacy_policy', 'confirmed_at', 'second_confirmed_at']
-    search_fields = ['user']
+    list_select_related = ('user', 'privacy_policy')
+    search_fields = get_user_search_fields()
+    search_help_text = _('Search by exact username or e-mail.')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('user', )
+    autocomplete_fields = ('privacy_policy', )
 
 
 class PrivacyPolicyAdmin(TranslationAdmin):
@@ -45,11 +111,90 @@ class PrivacyPolicyAdmin(TranslationAdmin):
     Creating and editing Privacy Policies. The confirmations
     are shown inline.
     """
-    list_display = ('title', 'published_at', 'for_group', 'active')
-    list_filter = ['published_at', 'active']
+    list_display = ('title', 'published_at', 'for_group', 'active',
+                    'active_from', 'active_until', 'rollout_percentage')
+    list_filter = ['published_at', 'active', 'active_from', 'active_until']
     search_fields = ['title', 'text']
     date_hierarchy = 'published_at'
 
 
+class PrivacyPolicyStatisticsAdmin(admin.ModelAdmin):
+    """
+    View the number of confirmations of each policy. The counters are
+    read from the statistics, so the confirmations are not counted.
+    """
+    list_display = ('privacy_policy', 'policy_title', 'for_group', 'active',
+                    'confirmed_count', 'second_pending_count', 'updated_at')
+    list_filter = ['privacy_policy__active']
+    list_select_related = ('privacy_policy', 'privacy_policy__for_group')
+
+    @admin.display(description=_('Title'))
+    def policy_title(self, obj):
+        return obj.privacy_policy.title
+
+    @admin.display(description=_('For group'))
+    def for_group(self, obj):
+        return obj.privacy_policy.for_group
+
+    @admin.display(description=_('Active'), boolean=True)
+    def active(self, obj):
+        return obj.privacy_policy.active
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ConsentCampaignAdmin(admin.ModelAdmin):
+    """
+    View the progress of the campaigns. The campaigns are started with the
+    management command consent_campaign.
+    """
+    list_display = ('privacy_policy', 'created_at', 'rollout_percentage',
+                    'total_users', 'notified_users', 'confirmed')
+    list_select_related = ('privacy_policy', 'privacy_policy__statistics')
+    date_hierarchy = 'created_at'
+
+    @admin.display(description=_('Rollout percentage'))
+    def rollout_percentage(self, obj):
+        return obj.privacy_policy.rollout_percentage
+
+    @admin.display(description=_('Confirmed'))
+    def confirmed(self, obj):
+        return get_progress(obj)['confirmed']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class OutgoingMailAdmin(admin.ModelAdmin):
+    """
+    View the queued e-mails. They are sent by the management command
+    send_queued_mail.
+    """
+    list_display = ('subject', 'recipients', 'created_at', 'attempts',
+                    'send_after', 'sent_at', 'expires_at')
+    list_filter = ['sent_at', 'created_at']
+    date_hierarchy = 'created_at'
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(PrivacyPolicy, PrivacyPolicyAdmin)
 admin.site.register(PrivacyPolicyConfirmation, PrivacyPolicyConfirmationAdmin)
+admin.site.register(PrivacyPolicyStatistics, PrivacyPolicyStatisticsAdmin)
+admin.site.register(ConsentCampaign, ConsentCampaignAdmin)
+admin.site.register(OutgoingMail, OutgoingMailAdmin)
@@ -31,3 +31,12 @@ class PrivacyPolicyToolsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'privacy_policy_tools'
     verbose_name = _('Privacy Policy Tools')
+
+    def ready(self):
+        """
+        Connects the signal receivers, registers the system checks and
+        imports the configured hooks.
+        """
+        from privacy_policy_tools import checks, signals  # noqa: F401
+        from privacy_policy_tools.utils import load_hooks
+        load_hooks()
@@ -0,0 +1,222 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides the campaigns to ask users to confirm a new policy.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from privacy_policy_tools.conf import get_settings
+from privacy_policy_tools.mail import get_body_template, render_subject
+from privacy_policy_tools.models import ConsentCampaign, \
+    ConsentCampaignRecipient, OutgoingMail, PrivacyPolicyConfirmation, \
+    PrivacyPolicyStatistics
+from privacy_policy_tools.utils import RateLimiter, in_rollout
+
+
+def get_campaign_users(policy):
+    """
+    Returns the active users who have to confirm the given policy and
+    have not confirmed it yet.
+
+    Keyword arguments:
+        - policy -- policy object
+    """
+    users = get_user_model().objects.filter(is_active=True)
+    if policy.for_group_id is not None:
+        users = users.filter(groups=policy.for_group_id)
+    elif not get_settings().DEFAULT_POLICY:
+        users = users.filter(groups=None)
+    confirmed = PrivacyPolicyConfirmation.objects.filter(
+        privacy_policy=policy).values('user_id')
+    return users.exclude(pk__in=confirmed).order_by('pk')
+
+
+def start_campaign(policy, batch_size=1000):
+    """
+    Starts a campaign for the given policy. The users who have to confirm
+    the policy are saved as recipients in batches, so the campaign is
+    able to track the notifications.
+
+    Keyword arguments:
+        - policy -- policy object
+        - batch_size -- number of recipients inserted at once
+
+    Returns:
+        the campaign
+    """
+    statistics = PrivacyPolicyStatistics.objects.filter(
+        privacy_policy=policy).first()
+    campaign = ConsentCampaign.objects.create(
+        privacy_policy=policy,
+        initial_confirmations=(statistics.confirmed_count
+                               if statistics is not None else 0))
+    users = get_campaign_users(policy)
+    last_pk = None
+    total = 0
+    while True:
+        batch = users
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        user_ids = list(batch.values_list('pk', flat=True)[:batch_size])
+        if len(user_ids) <= 0:
+            break
+        ConsentCampaignRecipient.objects.bulk_create([
+            ConsentCampaignRecipient(campaign=campaign, user_id=user_id)
+            for user_id in user_ids
+        ], ignore_conflicts=True)
+        last_pk = user_ids[-1]
+        total += len(user_ids)
+    campaign.total_users = total
+    campaign.save(update_fields=['total_users'])
+    return campaign
+
+
+def set_rollout(policy, percentage):
+    """
+    Activates the given policy for a percentage of the users. Saving the
+    policy invalidates the cached policies, so the users of the rollout
+    are asked to confirm the policy with their next request.
+
+    Keyword arguments:
+        - policy -- policy object
+        - percentage -- percentage of the users between 0 and 100
+    """
+    policy.rollout_percentage = percentage
+    policy.active = True
+    policy.save(update_fields=['rollout_percentage', 'active'])
+
+
+def notify_recipients(campaign, base_url, rate=None, batch_size=100):
+    """
+    Sends an e-mail to the recipients of the campaign who are part of the
+    rollout and who have not been notified or confirmed the policy yet.
+    All e-mails are sent using a single connection and at most rate
+    e-mails are sent per second. Each recipient is marked as notified
+    right after the e-mail was sent, so a run stopped by an error does not
+    notify anyone twice. If MAIL_OUTBOX is True the e-mails of a batch are
+    queued together with the marks instead.
+
+    Keyword arguments:
+        - campaign -- campaign object
+        - base_url -- scheme and host to build the link to the policy
+        - rate -- e-mails per second, unlimited if None
+        - batch_size -- number of recipients loaded at once
+
+    Yields:
+        the number of e-mails sent for each batch
+    """
+    policy = campaign.privacy_policy
+    confirm_url = base_url.rstrip('/') + reverse(
+        'privacy_policy_tools.views.confirm', args=(policy.id,))
+    # rendered once per run, so the subject may show the policy
+    subject = render_subject(
+        'privacy_policy_tools/consent_campaign_mail_subject.txt',
+        {'policy': policy})
+    template = get_body_template(
+        'privacy_policy_tools/consent_campaign_mail.txt')
+    from_email = get_settings().SECOND_CONFIRM_FROM_EMAIL
+    outbox = get_settings().MAIL_OUTBOX
+    email_field = get_user_model().get_email_field_name()
+    limiter = RateLimiter(rate)
+    recipients = campaign.recipients.filter(
+        notified_at=None).select_related('user').order_by('pk')
+    connection = get_connection()
+    last_pk = None
+    with connection:
+        while True:
+            batch = recipients
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if len(batch) <= 0:
+                break
+            last_pk = batch[-1].pk
+            confirmed = set(PrivacyPolicyConfirmation.objects.filter(
+                privacy_policy=policy,
+                user_id__in=[recipient.user_id for recipient in batch]
+            ).values_list('user_id', flat=True))
+            notified = []
+            mails = []
+            for recipient in batch:
+                email = getattr(recipient.user, email_field, None)
+                if not email or recipient.user_id in confirmed or \
+                        not in_rollout(policy, recipient.user_id):
+                    continue
+                body = template.render({
+                    'policy': policy,
+                    'user': recipient.user,
+                    'confirm_url': confirm_url,
+                })
+                notified.append(recipient.pk)
+                if outbox:
+                    mails.append(OutgoingMail(
+                        subject=subject, body=body, from_email=from_email,
+                        recipients=[email]))
+                    continue
+                limiter.wait()
+                connection.send_messages([EmailMessage(
+                    subject, body, from_email, [email],
+                    connection=connection)])
+                _mark_notified(campaign, [recipient.pk])
+            if outbox and len(mails) > 0:
+                with transaction.atomic():
+                    OutgoingMail.objects.bulk_create(mails)
+                    _mark_notified(campaign, notified)
+            yield len(notified)
+
+
+def _mark_notified(campaign, recipient_ids):
+    """
+    Saves that the given recipients of a campaign were notified.
+    """
+    ConsentCampaignRecipient.objects.filter(
+        pk__in=recipient_ids).update(notified_at=timezone.now())
+    ConsentCampaign.objects.filter(pk=campaign.pk).update(
+        notified_users=F('notified_users') + len(recipient_ids))
+
+
+def get_progress(campaign):
+    """
+    Returns the progress of the campaign. The confirmations are read from
+    the statistics of the policy, so no confirmations have to be counted.
+
+    Keyword arguments:
+        - campaign -- campaign object
+
+    Returns:
+        a dict with the number of users, notified users and confirmations
+    """
+    statistics = getattr(campaign.privacy_policy, 'statistics', None)
+    confirmed = 0
+    if statistics is not None:
+        confirmed = statistics.confirmed_count - \
+            campaign.initial_confirmations
+    return {
+        'total': campaign.total_users,
+        'notified': campaign.notified_users,
+        'confirmed': max(0, min(confirmed, campaign.total_users)),
+    }
@@ -0,0 +1,156 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides the system checks of the privacy_policy_tools.
+"""
+
+import re
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Warning, register
+from django.utils.module_loading import import_string
+
+from privacy_policy_tools.conf import DEFAULTS, get_raw_settings
+from privacy_policy_tools.tokens import TOKEN_BACKENDS
+from privacy_policy_tools.utils import compile_path_patterns
+
+BOOLEANS = ('DEFAULT_POLICY', 'REDIRECT_BEFORE_VIEW', 'MAIL_OUTBOX')
+INTEGERS = ('COMPLIANCE_CACHE_TIMEOUT', 'POLICY_SNAPSHOT_MAX_AGE',
+            'SECOND_CONFIRM_VALID_FOR_MINUTES',
+            'SECOND_CONFIRM_BULK_VALID_FOR_MINUTES',
+            'MAIL_OUTBOX_MAX_ATTEMPTS')
+STRINGS = ('POLICY_PAGE_URL', 'POLICY_CONFIRM_URL',
+           'SECOND_CONFIRM_REQUIRED_URL', 'SECOND_CONFIRM_URL', 'EXPORT_URL',
+           'SECOND_CONFIRM_FROM_EMAIL', 'CACHE')
+
+
+@register()
+def check_settings(app_configs, **kwargs):
+    """
+    Validates the setting PRIVACY_POLICY_TOOLS.
+    """
+    values = get_raw_settings()
+    if not isinstance(values, dict):
+        return [Error(
+            'PRIVACY_POLICY_TOOLS must be a dict.',
+            id='privacy_policy_tools.E001')]
+    errors = []
+    for key in values:
+        if key not in DEFAULTS:
+            errors.append(Warning(
+                'PRIVACY_POLICY_TOOLS contains the unknown key %s.' % key,
+                id='privacy_policy_tools.W001'))
+    enabled = values.get('ENABLED')
+    if enabled is not None and not isinstance(enabled, bool):
+        errors.append(Error(
+            'PRIVACY_POLICY_TOOLS["ENABLED"] must be True, False or None.',
+            id='privacy_policy_tools.E002'))
+    for key in BOOLEANS:
+        if key in values and not isinstance(values[key], bool):
+            errors.append(Error(
+                'PRIVACY_POLICY_TOOLS["%s"] must be a boolean.' % key,
+                id='privacy_policy_tools.E002'))
+    for key in INTEGERS:
+        value = values.get(key, DEFAULTS[key])
+        if isinstance(value, bool) or not isinstance(value, int) \
+                or value < 0:
+            errors.append(Error(
+                'PRIVACY_POLICY_TOOLS["%s"] must be a positive integer.'
+                % key,
+                id='privacy_policy_tools.E003'))
+    for key in STRINGS:
+        if not isinstance(values.get(key, DEFAULTS[key]), str):
+            errors.append(Error(
+                'PRIVACY_POLICY_TOOLS["%s"] must be a string.' % key,
+                id='privacy_policy_tools.E004'))
+    ignore_urls = values.get('IGNORE_URLS', DEFAULTS['IGNORE_URLS'])
+    if not isinstance(ignore_urls, (list, tuple)) or \
+            not all(isinstance(url, str) for url in ignore_urls):
+        errors.append(Error(
+            'PRIVACY_POLICY_TOOLS["IGNORE_URLS"] must be a list of strings.',
+            id='privacy_policy_tools.E005'))
+    else:
+        invalid = False
+        for url in ignore_urls:
+            if url.startswith('regex:'):
+                try:
+                    re.compile(url[len('regex:'):])
+                except re.error as e:
+                    invalid = True
+                    errors.append(Error(
+                        'PRIVACY_POLICY_TOOLS["IGNORE_URLS"] contains the '
+                        'invalid regular expression %s (%s).' % (url, e),
+                        id='privacy_policy_tools.E006'))
+        if not invalid:
+            try:
+                compile_path_patterns(ignore_urls)
+            except re.error as e:
+                errors.append(Error(
+                    'PRIVACY_POLICY_TOOLS["IGNORE_URLS"] could not be '
+                    'combined into a single regular expression (%s).' % e,
+                    id='privacy_policy_tools.E006'))
+    cache_control = values.get('POLICY_PAGE_CACHE_CONTROL')
+    if cache_control is not None and not isinstance(cache_control, dict):
+        errors.append(Error(
+            'PRIVACY_POLICY_TOOLS["POLICY_PAGE_CACHE_CONTROL"] must be a '
+            'dict.',
+            id='privacy_policy_tools.E008'))
+    vary = values.get('POLICY_PAGE_VARY', DEFAULTS['POLICY_PAGE_VARY'])
+    if not isinstance(vary, (list, tuple)) or \
+            not all(isinstance(header, str) for header in vary):
+        errors.append(Error(
+            'PRIVACY_POLICY_TOOLS["POLICY_PAGE_VARY"] must be a list of '
+            'strings.',
+            id='privacy_policy_tools.E009'))
+    backend = values.get('SECOND_CONFIRM_TOKEN_BACKEND',
+                         DEFAULTS['SECOND_CONFIRM_TOKEN_BACKEND'])
+    if backend not in TOKEN_BACKENDS:
+        errors.append(Error(
+            'PRIVACY_POLICY_TOOLS["SECOND_CONFIRM_TOKEN_BACKEND"] must be '
+            'one of %s.' % ', '.join(TOKEN_BACKENDS),
+            id='privacy_policy_tools.E010'))
+    cache = values.get('CACHE', DEFAULTS['CACHE'])
+    if isinstance(cache, str) and cache not in settings.CACHES:
+        errors.append(Error(
+            'PRIVACY_POLICY_TOOLS["CACHE"] is not configured in CACHES.',
+            id='privacy_policy_tools.E007'))
+    elif isinstance(cache, str) and _is_local_cache(settings.CACHES[cache]):
+        errors.append(Warning(
+            'PRIVACY_POLICY_TOOLS["CACHE"] uses LocMemCache, which is not '
+            'shared between processes.',
+            hint='Other processes notice changed policies only after '
+                 'POLICY_SNAPSHOT_MAX_AGE seconds. Use a shared cache, '
+                 'e.g. Redis or Memcached, if the project runs in more '
+                 'than one process.',
+            id='privacy_policy_tools.W002'))
+    return errors
+
+
+def _is_local_cache(cache_settings):
+    """
+    Returns True if the cache is local to each process.
+    """
+    try:
+        backend = import_string(cache_settings.get('BACKEND', ''))
+    except ImportError:
+        return False
+    return isinstance(backend, type) and issubclass(backend, LocMemCache)
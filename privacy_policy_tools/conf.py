@@ -0,0 +1,111 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides the settings of the privacy_policy_tools.
+"""
+
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': None,
+    'POLICY_PAGE_URL': 'terms/and/conditions',
+    'POLICY_CONFIRM_URL': 'terms/and/conditions/confirm',
+    'IGNORE_URLS': [],
+    'DEFAULT_POLICY': True,
+    'CACHE': 'default',
+    'POLICY_SNAPSHOT_MAX_AGE': 60,
+    'COMPLIANCE_CACHE_TIMEOUT': 300,
+    'REDIRECT_BEFORE_VIEW': False,
+    'POLICY_PAGE_CACHE_CONTROL': None,
+    'POLICY_PAGE_VARY': ['Accept-Language'],
+    'START_HOOK': None,
+    'SECOND_CONFIRMATION_REQUIRED_HOOK': None,
+    'SECOND_CONFIRMATION_GET_EMAIL_HOOK': None,
+    'SECOND_CONFIRMATION_SAVE_EMAIL_HOOK': None,
+    'SECOND_CONFIRMATION_EMAIL_HOOK': None,
+    'SECOND_CONFIRM_REQUIRED_URL': 'confirm/second/required',
+    'SECOND_CONFIRM_URL': 'confirm/second',
+    'EXPORT_URL': 'confirmations/export',
+    'SECOND_CONFIRM_FROM_EMAIL': 'no-reply@example.com',
+    'SECOND_CONFIRM_VALID_FOR_MINUTES': 10,
+    'SECOND_CONFIRM_BULK_VALID_FOR_MINUTES': 7 * 24 * 60,
+    'SECOND_CONFIRM_TOKEN_BACKEND': 'db',
+    'MAIL_OUTBOX': False,
+    'MAIL_OUTBOX_MAX_ATTEMPTS': 5,
+}
+
+
+class PrivacyPolicySettings(object):
+    """
+    This class provides the values of the setting PRIVACY_POLICY_TOOLS
+    as read-only attributes. Missing values are set to their defaults.
+    """
+    __slots__ = tuple(DEFAULTS)
+
+    def __init__(self, values):
+        """
+        constructor: sets the attributes
+
+        Keyword arguments:
+            - values -- dict of configured values
+        """
+        for key, default in DEFAULTS.items():
+            value = values.get(key, default)
+            if isinstance(value, list):
+                value = tuple(value)
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('The settings are read-only.')
+
+    def __delattr__(self, key):
+        raise AttributeError('The settings are read-only.')
+
+
+_settings = None
+
+
+def get_raw_settings():
+    """
+    Returns the configured dict PRIVACY_POLICY_TOOLS or an empty dict.
+    """
+    values = getattr(settings, 'PRIVACY_POLICY_TOOLS', None)
+    if values is None:
+        return {}
+    return values
+
+
+def get_settings():
+    """
+    Returns the settings of the app. They are built on the first call.
+    """
+    global _settings
+    if _settings is None:
+        _settings = PrivacyPolicySettings(get_raw_settings())
+    return _settings
+
+
+def reset_settings():
+    """
+    Forgets the built settings, e.g. if the settings changed.
+    """
+    global _settings
+    _settings = None
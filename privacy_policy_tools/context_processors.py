@@ -23,7 +23,9 @@
 This module provides some context processors.
 """
 
-from privacy_policy_tools.utils import get_setting
+from django.conf import settings
+
+from privacy_policy_tools.conf import get_raw_settings, get_settings
 
 
 def privacy_tools(request):
@@ -37,10 +39,12 @@ def privacy_tools(request):
     Keyword arguments:
         - request -- the calling HttpRequest
     """
-    enabled = get_setting(
-        'ENABLED',
-        'terms/and/conditions'
-    )
+    enabled = get_settings().ENABLED
+    if getattr(settings, 'PRIVACY_POLICY_TOOLS', None) is not None and \
+            'ENABLED' not in get_raw_settings():
+        # kept for backward compatibility: a configured app without the
+        # key ENABLED has always been reported as enabled
+        enabled = 'terms/and/conditions'
     v = {
         'privacy_enabled': enabled,
         'privacy_view': 'privacy_policy_tools.views.show'
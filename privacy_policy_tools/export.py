@@ -0,0 +1,121 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides the export of confirmations for audits. The rows are
+streamed from the database, so the memory usage does not depend on the
+number of confirmations.
+"""
+
+import csv
+import json
+import zlib
+
+from django.contrib.auth import get_user_model
+
+from privacy_policy_tools.models import PrivacyPolicyConfirmation
+
+FORMATS = ('csv', 'jsonl')
+HEADER = ('id', 'user_id', 'username', 'policy_id', 'policy_title',
+          'confirmed_at', 'second_confirmed_at')
+
+
+class Echo(object):
+    """
+    File like object which returns the written value instead of storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_rows(chunk_size=2000):
+    """
+    Returns an iterator over the confirmations as tuples in the order of
+    HEADER.
+
+    Keyword arguments:
+        - chunk_size -- number of rows fetched from the database at once
+    """
+    username = 'user__' + get_user_model().USERNAME_FIELD
+    return PrivacyPolicyConfirmation.objects.order_by('pk').values_list(
+        'id', 'user_id', username, 'privacy_policy_id',
+        'privacy_policy__title', 'confirmed_at', 'second_confirmed_at'
+    ).iterator(chunk_size=chunk_size)
+
+
+def export_confirmations(format='csv', compress=False, chunk_size=2000):
+    """
+    Returns an iterator over the exported confirmations as bytes.
+
+    Keyword arguments:
+        - format -- csv or jsonl
+        - compress -- True to compress the output with gzip
+        - chunk_size -- number of rows fetched from the database at once
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown format: %s' % format)
+    rows = get_rows(chunk_size)
+    if format == 'csv':
+        lines = _csv_lines(rows)
+    else:
+        lines = _jsonl_lines(rows)
+    if compress:
+        return _gzip(lines)
+    return lines
+
+
+def _csv_lines(rows):
+    """
+    Yields the header and the rows as CSV lines.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER).encode('utf-8')
+    for row in rows:
+        yield writer.writerow(_format_row(row)).encode('utf-8')
+
+
+def _jsonl_lines(rows):
+    """
+    Yields the rows as JSON lines.
+    """
+    for row in rows:
+        line = json.dumps(dict(zip(HEADER, _format_row(row))))
+        yield (line + '\n').encode('utf-8')
+
+
+def _format_row(row):
+    """
+    Converts the dates of a row to ISO 8601 strings.
+    """
+    return [value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in row]
+
+
+def _gzip(lines):
+    """
+    Compresses the given lines on the fly with gzip.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for line in lines:
+        data = compressor.compress(line)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,126 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module renders and sends the e-mails of the app. Subjects which do
+not depend on the recipient or a policy are rendered once per language. The
+templates of the bodies are compiled once. No request is needed, so the
+e-mails can be rendered by commands and background workers.
+"""
+
+from django.core.mail import send_mail
+from django.template.loader import get_template, render_to_string
+from django.utils.translation import get_language
+
+from privacy_policy_tools.conf import get_settings
+from privacy_policy_tools.outbox import queue_mail
+from privacy_policy_tools.tokens import get_expiry
+
+SECOND_CONFIRM_SUBJECT = \
+    'privacy_policy_tools/second_confirm_mail_subject.txt'
+SECOND_CONFIRM_BODY = 'privacy_policy_tools/second_confirm_mail.txt'
+
+_subjects = {}
+_templates = {}
+
+
+def get_subject(template_name):
+    """
+    Returns the subject rendered from a template in the current language.
+    The subject is rendered once per language.
+
+    Keyword arguments:
+        - template_name -- name of the template of the subject
+    """
+    key = (template_name, get_language())
+    subject = _subjects.get(key)
+    if subject is None:
+        subject = render_subject(template_name)
+        _subjects[key] = subject
+    return subject
+
+
+def render_subject(template_name, context=None):
+    """
+    Renders a subject which depends on its context, e.g. on a policy. It
+    is not cached.
+
+    Keyword arguments:
+        - template_name -- name of the template of the subject
+        - context -- dict of the context of the template
+    """
+    # line breaks are not allowed in the subject of an e-mail
+    return ' '.join(render_to_string(template_name, context).split())
+
+
+def get_body_template(template_name):
+    """
+    Returns the compiled template of the body of an e-mail. The template
+    is compiled once.
+
+    Keyword arguments:
+        - template_name -- name of the template of the body
+    """
+    template = _templates.get(template_name)
+    if template is None:
+        template = get_template(template_name)
+        _templates[template_name] = template
+    return template
+
+
+def clear_templates():
+    """
+    Forgets the rendered subjects and the compiled templates, e.g. if the
+    settings changed.
+    """
+    _subjects.clear()
+    _templates.clear()
+
+
+def render_second_confirm_mail(confirm_url):
+    """
+    Returns the subject and the body of the e-mail requesting a second
+    confirmation.
+
+    Keyword arguments:
+        - confirm_url -- absolute URL of the second confirmation
+    """
+    body = get_body_template(SECOND_CONFIRM_BODY).render({
+        'confirm_url': confirm_url,
+    })
+    return get_subject(SECOND_CONFIRM_SUBJECT), body
+
+
+def send_second_confirm_mail(email, confirm_url):
+    """
+    Sends the e-mail requesting a second confirmation or queues it if
+    MAIL_OUTBOX is True. A queued e-mail is dropped once its link expired.
+
+    Keyword arguments:
+        - email -- address of the person for the second confirmation
+        - confirm_url -- absolute URL of the second confirmation
+    """
+    subject, body = render_second_confirm_mail(confirm_url)
+    from_email = get_settings().SECOND_CONFIRM_FROM_EMAIL
+    if get_settings().MAIL_OUTBOX:
+        queue_mail(subject, body, from_email, [email],
+                   expires_at=get_expiry())
+    else:
+        send_mail(subject, body, from_email, [email], fail_silently=False)
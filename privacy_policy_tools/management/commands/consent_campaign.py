@@ -0,0 +1,137 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides a command to run a campaign to confirm a new policy.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from privacy_policy_tools.campaigns import start_campaign, set_rollout, \
+    notify_recipients, get_progress
+from privacy_policy_tools.models import ConsentCampaign, PrivacyPolicy
+
+
+class Command(BaseCommand):
+    """
+    Starts a campaign for a policy, raises the rollout of the policy step
+    by step, notifies the users by e-mail and reports the progress.
+    """
+    help = 'Runs a campaign to ask users to confirm a policy.'
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+        start = actions.add_parser(
+            'start', help='Starts a campaign for a policy.')
+        start.add_argument('policy_id', type=int)
+        start.add_argument('--rollout', type=int, default=None,
+                           help='Activates the policy for a percentage '
+                                'of the users.')
+        start.add_argument('--batch-size', type=int, default=1000,
+                           help='Number of recipients inserted at once.')
+        rollout = actions.add_parser(
+            'rollout', help='Changes the rollout of the policy.')
+        rollout.add_argument('campaign_id', type=int)
+        rollout.add_argument('percentage', type=int)
+        notify = actions.add_parser(
+            'notify', help='Notifies the users of the rollout by e-mail.')
+        notify.add_argument('campaign_id', type=int)
+        notify.add_argument('--base-url', required=True,
+                            help='Scheme and host of the site, e.g. '
+                                 'https://example.com')
+        notify.add_argument('--rate', type=float, default=None,
+                            help='Maximum number of e-mails per second.')
+        notify.add_argument('--batch-size', type=int, default=100,
+                            help='Number of recipients loaded at once.')
+        status = actions.add_parser(
+            'status', help='Reports the progress of the campaign.')
+        status.add_argument('campaign_id', type=int)
+
+    def handle(self, *args, **options):
+        getattr(self, '_' + options['action'])(options)
+
+    def _start(self, options):
+        """
+        Starts a campaign and optionally activates the policy.
+        """
+        policy = self._get(PrivacyPolicy, options['policy_id'])
+        campaign = start_campaign(policy, options['batch_size'])
+        if options['rollout'] is not None:
+            set_rollout(policy, self._percentage(options['rollout']))
+        self.stdout.write(self.style.SUCCESS(
+            'Started campaign %d for %d users.' % (
+                campaign.pk, campaign.total_users)))
+
+    def _rollout(self, options):
+        """
+        Changes the rollout of the policy of a campaign.
+        """
+        campaign = self._get(ConsentCampaign, options['campaign_id'])
+        percentage = self._percentage(options['percentage'])
+        set_rollout(campaign.privacy_policy, percentage)
+        self.stdout.write(self.style.SUCCESS(
+            'Rolled out the policy to %d%% of the users.' % percentage))
+
+    def _notify(self, options):
+        """
+        Notifies the recipients of a campaign by e-mail.
+        """
+        campaign = self._get(ConsentCampaign, options['campaign_id'])
+        total = 0
+        for sent in notify_recipients(campaign, options['base_url'],
+                                      options['rate'],
+                                      options['batch_size']):
+            total += sent
+            self.stdout.write('%d e-mails sent' % total)
+        self.stdout.write(self.style.SUCCESS(
+            'Notified %d users.' % total))
+
+    def _status(self, options):
+        """
+        Reports the progress of a campaign.
+        """
+        campaign = self._get(ConsentCampaign, options['campaign_id'])
+        progress = get_progress(campaign)
+        percent = 100.0
+        if progress['total'] > 0:
+            percent = 100.0 * progress['confirmed'] / progress['total']
+        self.stdout.write(
+            'Rollout: %d%%\nUsers: %d\nNotified: %d\nConfirmed: %d '
+            '(%.1f%%)' % (campaign.privacy_policy.rollout_percentage,
+                          progress['total'], progress['notified'],
+                          progress['confirmed'], percent))
+
+    def _get(self, model, pk):
+        """
+        Returns an object or raises a CommandError if it does not exist.
+        """
+        try:
+            return model.objects.get(pk=pk)
+        except model.DoesNotExist:
+            raise CommandError('%s %d does not exist.' % (
+                model._meta.verbose_name, pk))
+
+    def _percentage(self, percentage):
+        """
+        Validates a percentage of the rollout.
+        """
+        if percentage < 0 or percentage > 100:
+            raise CommandError('The percentage has to be between 0 and 100.')
+        return percentage
@@ -0,0 +1,57 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides a command to delete the expired tokens.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from privacy_policy_tools.tokens import iter_delete_expired_tokens
+
+
+class Command(BaseCommand):
+    """
+    Deletes the tokens of the second confirmation which have expired. The
+    tokens are deleted in short batches, optionally with a pause between
+    them, and the throughput is reported.
+    """
+    help = 'Deletes the expired tokens of the second confirmation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Maximum number of tokens deleted at once.')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Seconds to wait between the batches.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        for deleted in iter_delete_expired_tokens(options['batch_size']):
+            total += deleted
+            self.stdout.write('%d tokens deleted' % total)
+            if options['sleep'] > 0:
+                time.sleep(options['sleep'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            'Deleted %d tokens in %.1f seconds (%.0f tokens per second).' % (
+                total, elapsed, total / elapsed if elapsed > 0 else 0)))
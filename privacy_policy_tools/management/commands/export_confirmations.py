@@ -0,0 +1,64 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides a command to export all confirmations for audits.
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand
+
+from privacy_policy_tools.export import FORMATS, export_confirmations
+
+
+class Command(BaseCommand):
+    """
+    Streams all confirmations as CSV or JSON lines into a file or to the
+    standard output.
+    """
+    help = 'Exports all confirmations as CSV or JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv',
+                            help='Format of the export.')
+        parser.add_argument('--gzip', action='store_true',
+                            help='Compress the export with gzip.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of rows fetched at once.')
+        parser.add_argument('--output', default='-',
+                            help='File to write, - for standard output.')
+
+    def handle(self, *args, **options):
+        chunks = export_confirmations(options['format'], options['gzip'],
+                                      options['chunk_size'])
+        if options['output'] == '-':
+            self._write(sys.stdout.buffer, chunks)
+            sys.stdout.buffer.flush()
+        else:
+            with open(options['output'], 'wb') as output:
+                self._write(output, chunks)
+
+    def _write(self, output, chunks):
+        """
+        Writes the exported chunks to a binary file.
+        """
+        for chunk in chunks:
+            output.write(chunk)
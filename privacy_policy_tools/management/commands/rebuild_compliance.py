@@ -0,0 +1,87 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides a command to rebuild the compliance of all users.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from privacy_policy_tools.models import PrivacyPolicyConfirmation, \
+    PrivacyPolicyCompliance
+from privacy_policy_tools.utils import bulk_upsert
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the compliance of all users from their confirmations. The
+    users are processed in batches ordered by their primary key.
+    """
+    help = 'Rebuilds the compliance of all users from their confirmations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of users per batch.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = get_user_model().objects.order_by('pk')
+        last_pk = None
+        total = 0
+        while True:
+            batch = users
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            user_ids = list(batch.values_list('pk', flat=True)[:batch_size])
+            if len(user_ids) <= 0:
+                break
+            self._rebuild(user_ids)
+            last_pk = user_ids[-1]
+            total += len(user_ids)
+            self.stdout.write('%d users processed' % total)
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt the compliance of %d users.' % total))
+
+    def _rebuild(self, user_ids):
+        """
+        Rebuilds the compliance of the given users.
+
+        Keyword arguments:
+            - user_ids -- list of ids of users
+        """
+        confirmed = {user_id: set() for user_id in user_ids}
+        pending = {user_id: set() for user_id in user_ids}
+        for user_id, policy_id, second_confirmed_at in \
+                PrivacyPolicyConfirmation.objects.filter(
+                    user_id__in=user_ids).values_list(
+                    'user_id', 'privacy_policy_id', 'second_confirmed_at'):
+            confirmed[user_id].add(policy_id)
+            if second_confirmed_at is None:
+                pending[user_id].add(policy_id)
+        bulk_upsert(
+            PrivacyPolicyCompliance,
+            [PrivacyPolicyCompliance(
+                user_id=user_id,
+                confirmed_policies=sorted(confirmed[user_id]),
+                pending_policies=sorted(pending[user_id]))
+             for user_id in user_ids],
+            'user',
+            ['confirmed_policies', 'pending_policies', 'updated_at'])
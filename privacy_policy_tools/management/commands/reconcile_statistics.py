@@ -0,0 +1,61 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides a command to correct the statistics of all policies.
+"""
+
+from django.db.models import Count, Q
+from django.core.management.base import BaseCommand
+
+from privacy_policy_tools.models import PrivacyPolicy, \
+    PrivacyPolicyConfirmation, PrivacyPolicyStatistics
+from privacy_policy_tools.utils import bulk_upsert
+
+
+class Command(BaseCommand):
+    """
+    Counts the confirmations of all policies and corrects the counters of
+    the statistics. Run it periodically to fix any drift.
+    """
+    help = 'Corrects the statistics of all policies.'
+
+    def handle(self, *args, **options):
+        counts = {
+            row['privacy_policy_id']: row
+            for row in PrivacyPolicyConfirmation.objects.order_by().values(
+                'privacy_policy_id'
+            ).annotate(
+                confirmed=Count('id'),
+                pending=Count('id', filter=Q(second_confirmed_at=None))
+            )
+        }
+        statistics = []
+        for policy_id in PrivacyPolicy.objects.values_list('id', flat=True):
+            row = counts.get(policy_id, {})
+            statistics.append(PrivacyPolicyStatistics(
+                privacy_policy_id=policy_id,
+                confirmed_count=row.get('confirmed', 0),
+                second_pending_count=row.get('pending', 0)))
+        bulk_upsert(PrivacyPolicyStatistics, statistics, 'privacy_policy',
+                    ['confirmed_count', 'second_pending_count',
+                     'updated_at'])
+        self.stdout.write(self.style.SUCCESS(
+            'Corrected the statistics of %d policies.' % len(statistics)))
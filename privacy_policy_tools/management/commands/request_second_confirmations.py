@@ -0,0 +1,103 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides a command to request all missing second
+confirmations by e-mail.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from privacy_policy_tools.second_confirmation import \
+    iter_request_second_confirmations
+from privacy_policy_tools.utils import get_hook
+
+
+class Command(BaseCommand):
+    """
+    Sends an e-mail to request a second confirmation for every confirmation
+    which misses it. The id of the last processed confirmation is saved to
+    a checkpoint file after each e-mail, so an interrupted run continues
+    after the last e-mail which was sent.
+    """
+    help = 'Requests all missing second confirmations by e-mail.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', required=True,
+                            help='Scheme and host of the site, e.g. '
+                                 'https://example.com')
+        parser.add_argument('--policy', type=int, default=None,
+                            help='Id of a policy to process its '
+                                 'confirmations only.')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='Maximum number of e-mails per second.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of confirmations loaded at once.')
+        parser.add_argument('--checkpoint', default=None,
+                            help='File to save the progress to resume an '
+                                 'interrupted run.')
+
+    def handle(self, *args, **options):
+        if get_hook('SECOND_CONFIRMATION_EMAIL_HOOK') is None:
+            raise CommandError(
+                'SECOND_CONFIRMATION_EMAIL_HOOK is not configured.')
+        checkpoint = options['checkpoint']
+        start_after = self._read_checkpoint(checkpoint)
+        if start_after is not None:
+            self.stdout.write('Resuming after confirmation %d' % start_after)
+        total = 0
+        reported = 0
+        for last_pk, sent in iter_request_second_confirmations(
+                options['base_url'], options['rate'],
+                options['batch_size'], start_after, options['policy']):
+            total += sent
+            self._write_checkpoint(checkpoint, last_pk)
+            if total - reported >= options['batch_size']:
+                reported = total
+                self.stdout.write(
+                    '%d e-mails sent, last confirmation %d' % (
+                        total, last_pk))
+        self.stdout.write(self.style.SUCCESS('Sent %d e-mails.' % total))
+
+    def _read_checkpoint(self, checkpoint):
+        """
+        Returns the id of the last processed confirmation or None.
+        """
+        if checkpoint is None or not os.path.exists(checkpoint):
+            return None
+        with open(checkpoint) as f:
+            value = f.read().strip()
+        try:
+            return int(value) if value else None
+        except ValueError:
+            raise CommandError('Invalid checkpoint file %s.' % checkpoint)
+
+    def _write_checkpoint(self, checkpoint, last_pk):
+        """
+        Saves the id of the last processed confirmation atomically.
+        """
+        if checkpoint is None:
+            return
+        tmp = checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('%d\n' % last_pk)
+        os.replace(tmp, checkpoint)
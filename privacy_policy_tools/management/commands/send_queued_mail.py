@@ -0,0 +1,71 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides a command to send the queued e-mails.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from privacy_policy_tools.outbox import iter_send_queued_mail
+
+
+class Command(BaseCommand):
+    """
+    Sends the queued e-mails which are due using a single connection to
+    the mail server. With --loop the queue is polled until the command is
+    stopped.
+    """
+    help = 'Sends the queued e-mails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of e-mails claimed at once.')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='Maximum number of e-mails per second.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the queue.')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds to wait if the queue is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = self._send(options)
+            if sent or failed or not options['loop']:
+                self.stdout.write(
+                    '%d e-mails sent, %d failed' % (sent, failed))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def _send(self, options):
+        """
+        Sends all due e-mails and returns the number of sent and failed
+        e-mails.
+        """
+        sent = 0
+        failed = 0
+        for batch_sent, batch_failed in iter_send_queued_mail(
+                options['batch_size'], options['rate']):
+            sent += batch_sent
+            failed += batch_failed
+        return sent, failed
@@ -22,89 +22,213 @@
 """
 This module provides some middleware for the package privacy_policy_tools.
 """
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, \
+    sync_to_async
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from django.conf import settings
 from django.utils.http import url_has_allowed_host_and_scheme
-from privacy_policy_tools.utils import get_setting, get_active_policies, \
-    get_by_py_path
-from privacy_policy_tools.models import PrivacyPolicyConfirmation
+from privacy_policy_tools.conf import get_settings
+from privacy_policy_tools.utils import get_active_policies, \
+    get_hook, get_applicable_policies, get_outstanding_confirmations, \
+    is_compliant, set_compliance, get_ignore_pattern, \
+    aget_active_policies, aget_outstanding_confirmations, ais_compliant, \
+    aset_compliance
 
 
 class PrivacyPolicyMiddleware(object):
     """
     This middleware class forces the user to confirm the privacy policies.
+    It supports both, synchronous and asynchronous requests.
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         """
-        constructor: sets get_response
+        constructor: sets get_response and compiles the URLs which are
+        not checked
         """
         self.get_response = get_response
+        get_ignore_pattern()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
         """
         Processes the request and redirect to the privacy policy if
         the user has not confirmed it yet.
 
+        If REDIRECT_BEFORE_VIEW is True the check is done before the view
+        is called, so the view is not processed for users who have to be
+        redirected.
+
         Keyword arguments:
             - request -- calling HttpRequest
         """
+        if self.async_mode:
+            return self.__acall__(request)
+        if get_settings().REDIRECT_BEFORE_VIEW:
+            redirect = self._check(request)
+            if redirect is not None:
+                return redirect
+            return self.get_response(request)
         response = self.get_response(request)
-        enabled = get_setting('ENABLED')
-        if enabled is None:
-            return response
-        if enabled is True:
-            url = get_setting(
-                'POLICY_PAGE_URL',
-                'terms/and/conditions'
-            )
-            ignore_urls = get_setting(
-                'IGNORE_URLS',
-                []
-            )
-            if request.user.is_authenticated and \
-                    url not in request.path_info and \
-                    all(ignore not in request.path_info
-                        for ignore in ignore_urls):
-                start_hook = get_setting('START_HOOK', None)
-                if start_hook is not None:
-                    start_hook = get_by_py_path(start_hook)
-                    if start_hook(request) is False:
-                        return response
-                policies = get_active_policies()
-                if len(policies) <= 0:
-                    return response
-                for policy in policies:
-                    if get_setting('DEFAULT_POLICY', True):
-                        no = policy.for_group is None
-                    else:
-                        no = policy.for_group is None \
-                            and len(request.user.groups.all()) <= 0
-                    if policy.for_group in request.user.groups.all() or no:
-                        confirms = PrivacyPolicyConfirmation.objects.filter(
-                            privacy_policy=policy, user=request.user)
-                        if len(confirms) <= 0:
-                            next_view = self._generate_next(request)
-                            return HttpResponseRedirect(reverse(
-                                'privacy_policy_tools.views.confirm',
-                                args=(policy.id, next_view,)))
-                        else:
-                            second = self._second_confirmation(
-                                request, confirms.first())
-                            if second is not None:
-                                return second
+        redirect = self._check(request)
+        if redirect is not None:
+            return redirect
         return response
 
+    async def __acall__(self, request):
+        """
+        Async version of __call__().
+
+        Keyword arguments:
+            - request -- calling HttpRequest
+        """
+        if get_settings().REDIRECT_BEFORE_VIEW:
+            redirect = await self._acheck(request)
+            if redirect is not None:
+                return redirect
+            return await self.get_response(request)
+        response = await self.get_response(request)
+        redirect = await self._acheck(request)
+        if redirect is not None:
+            return redirect
+        return response
+
+    def _is_ignored(self, request):
+        """
+        Returns True if the request is not checked.
+
+        Keyword arguments:
+            - request -- calling HttpRequest
+        """
+        if get_settings().ENABLED is not True:
+            return True
+        ignore = get_ignore_pattern()
+        return ignore is not None and \
+            ignore.search(request.path_info) is not None
+
+    def _check(self, request):
+        """
+        Returns a redirect to the privacy policy if the user has not
+        confirmed it yet or None otherwise.
+
+        Keyword arguments:
+            - request -- calling HttpRequest
+        """
+        if self._is_ignored(request):
+            return None
+        if not request.user.is_authenticated:
+            return None
+        start_hook = get_hook('START_HOOK')
+        if start_hook is not None:
+            if start_hook(request) is False:
+                return None
+        policies = get_active_policies()
+        if len(policies) <= 0:
+            return None
+        if is_compliant(request.user, policies):
+            return None
+        group_ids = set(request.user.groups.values_list('id', flat=True))
+        with_pending = get_hook('SECOND_CONFIRMATION_REQUIRED_HOOK') \
+            is not None
+        unconfirmed, pending = get_outstanding_confirmations(
+            request.user, policies, group_ids, with_pending)
+        applicable = get_applicable_policies(policies, group_ids,
+                                             request.user.pk)
+        for policy in applicable:
+            if policy.id in unconfirmed:
+                next_view = self._generate_next(request)
+                return HttpResponseRedirect(reverse(
+                    'privacy_policy_tools.views.confirm',
+                    args=(policy.id, next_view,)))
+            if policy.id in pending:
+                second = self._second_confirmation(
+                    request, pending[policy.id])
+                if second is not None:
+                    return second
+        set_compliance(request.user, group_ids,
+                       set(policy.id for policy in applicable))
+        return None
+
+    async def _acheck(self, request):
+        """
+        Async version of _check(). The user, the policies and the
+        confirmations are loaded without leaving the event loop. Only the
+        hooks are called in a thread.
+
+        Keyword arguments:
+            - request -- calling HttpRequest
+        """
+        if self._is_ignored(request):
+            return None
+        user = await self._aget_user(request)
+        if not user.is_authenticated:
+            return None
+        start_hook = get_hook('START_HOOK')
+        if start_hook is not None:
+            if await sync_to_async(start_hook)(request) is False:
+                return None
+        policies = await aget_active_policies()
+        if len(policies) <= 0:
+            return None
+        if await ais_compliant(user, policies):
+            return None
+        group_ids = set([group_id async for group_id in
+                         user.groups.values_list('id', flat=True)])
+        with_pending = get_hook('SECOND_CONFIRMATION_REQUIRED_HOOK') \
+            is not None
+        unconfirmed, pending = await aget_outstanding_confirmations(
+            user, policies, group_ids, with_pending)
+        applicable = get_applicable_policies(policies, group_ids, user.pk)
+        for policy in applicable:
+            if policy.id in unconfirmed:
+                next_view = self._generate_next(request)
+                return HttpResponseRedirect(reverse(
+                    'privacy_policy_tools.views.confirm',
+                    args=(policy.id, next_view,)))
+            if policy.id in pending and with_pending:
+                second = await sync_to_async(self._second_confirmation)(
+                    request, pending[policy.id])
+                if second is not None:
+                    return second
+        await aset_compliance(user, group_ids,
+                              set(policy.id for policy in applicable))
+        return None
+
+    async def _aget_user(self, request):
+        """
+        Returns the user of the request without blocking the event loop.
+
+        Keyword arguments:
+            - request -- calling HttpRequest
+        """
+        auser = getattr(request, 'auser', None)
+        if auser is not None:
+            return await auser()
+        return await sync_to_async(self._get_user)(request)
+
+    def _get_user(self, request):
+        """
+        Evaluates and returns the lazy user of the request.
+
+        Keyword arguments:
+            - request -- calling HttpRequest
+        """
+        user = request.user
+        # accessing an attribute loads the user of the lazy object
+        user.is_authenticated
+        return user
+
     def _second_confirmation(self, request, confirmation):
-        required_hook = get_setting('SECOND_CONFIRMATION_REQUIRED_HOOK',
-                                    None)
+        required_hook = get_hook('SECOND_CONFIRMATION_REQUIRED_HOOK')
         if required_hook is None:
             return None
-        if required_hook is not None:
-            required_hook = get_by_py_path(required_hook)
-            if required_hook(request, confirmation) is False:
-                return None
+        if required_hook(request, confirmation) is False:
+            return None
         if confirmation.second_confirmed_at is not None:
             return None
         return HttpResponseRedirect(reverse(
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:03
+
+from django.db import migrations
+from django.db.models import Count, F, Q
+
+BATCH_SIZE = 100
+
+
+def remove_duplicate_confirmations(apps, schema_editor):
+    """
+    Keeps one confirmation per user and policy. A confirmation with a
+    second confirmation is preferred, otherwise the oldest one is kept.
+    The pairs of user and policy with duplicates are found by the
+    database and only their confirmations are loaded, in batches of
+    pairs.
+    """
+    Confirmation = apps.get_model('privacy_policy_tools',
+                                  'PrivacyPolicyConfirmation')
+    pairs = list(Confirmation.objects.order_by().values(
+        'user_id', 'privacy_policy_id'
+    ).annotate(
+        count=Count('id')
+    ).filter(
+        count__gt=1
+    ).values_list('user_id', 'privacy_policy_id'))
+    for i in range(0, len(pairs), BATCH_SIZE):
+        query = Q()
+        for user_id, policy_id in pairs[i:i + BATCH_SIZE]:
+            query |= Q(user_id=user_id, privacy_policy_id=policy_id)
+        confirmations = Confirmation.objects.filter(query).order_by(
+            'user_id', 'privacy_policy_id',
+            F('second_confirmed_at').asc(nulls_last=True), 'id'
+        ).values_list('id', 'user_id', 'privacy_policy_id')
+        last = None
+        duplicates = []
+        for pk, user_id, policy_id in confirmations:
+            if (user_id, policy_id) == last:
+                duplicates.append(pk)
+            last = (user_id, policy_id)
+        Confirmation.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+    """
+    The duplicates are removed in a migration of their own, so the deletes
+    are committed before the unique constraint is added. Otherwise
+    PostgreSQL refuses to alter a table with pending trigger events.
+    """
+
+    dependencies = [
+        ('privacy_policy_tools', '0010_alter_privacypolicy_text_alter_privacypolicy_text_de_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_confirmations,
+                             migrations.RunPython.noop),
+    ]
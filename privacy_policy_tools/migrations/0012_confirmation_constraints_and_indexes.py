@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_policy_tools', '0011_remove_duplicate_confirmations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='onetimetoken',
+            index=models.Index(fields=['confirmation', 'token'], name='privacy_policy_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privacypolicy',
+            index=models.Index(fields=['active', 'for_group', '-published_at'], name='privacy_policy_active_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='privacypolicyconfirmation',
+            constraint=models.UniqueConstraint(fields=('user', 'privacy_policy'), name='privacy_policy_unique_confirm'),
+        ),
+    ]
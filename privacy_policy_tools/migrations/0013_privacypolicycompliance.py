@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('privacy_policy_tools', '0012_confirmation_constraints_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrivacyPolicyCompliance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='privacy_policy_compliance', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+                ('confirmed_policies', models.JSONField(default=list, verbose_name='Confirmed policies')),
+                ('pending_policies', models.JSONField(default=list, verbose_name='Policies without second confirmation')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated at')),
+            ],
+            options={
+                'verbose_name': 'Privacy Policy Compliance',
+                'verbose_name_plural': 'Privacy Policy Compliances',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_policy_tools', '0013_privacypolicycompliance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrivacyPolicyStatistics',
+            fields=[
+                ('privacy_policy', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='privacy_policy_tools.privacypolicy', verbose_name='Privacy Policy')),
+                ('confirmed_count', models.BigIntegerField(default=0, verbose_name='Confirmed')),
+                ('second_pending_count', models.BigIntegerField(default=0, verbose_name='Second confirmation pending')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated at')),
+            ],
+            options={
+                'verbose_name': 'Privacy Policy Statistics',
+                'verbose_name_plural': 'Privacy Policy Statistics',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:10
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('privacy_policy_tools', '0014_privacypolicystatistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='privacypolicy',
+            name='rollout_percentage',
+            field=models.PositiveSmallIntegerField(default=100, help_text='Percentage of users who have to confirm the policy. Increase it step by step to spread the confirmations over time.', validators=[django.core.validators.MaxValueValidator(100)], verbose_name='Rollout percentage'),
+        ),
+        migrations.CreateModel(
+            name='ConsentCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('total_users', models.BigIntegerField(default=0, verbose_name='Users')),
+                ('notified_users', models.BigIntegerField(default=0, verbose_name='Notified users')),
+                ('initial_confirmations', models.BigIntegerField(default=0, verbose_name='Initial confirmations')),
+                ('privacy_policy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='campaigns', to='privacy_policy_tools.privacypolicy', verbose_name='Privacy Policy')),
+            ],
+            options={
+                'verbose_name': 'Consent Campaign',
+                'verbose_name_plural': 'Consent Campaigns',
+            },
+        ),
+        migrations.CreateModel(
+            name='ConsentCampaignRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notified_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Notified at')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='privacy_policy_tools.consentcampaign', verbose_name='Consent Campaign')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Consent Campaign Recipient',
+                'verbose_name_plural': 'Consent Campaign Recipients',
+                'indexes': [models.Index(fields=['campaign', 'notified_at'], name='privacy_policy_recipient_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='consentcampaignrecipient',
+            constraint=models.UniqueConstraint(fields=('campaign', 'user'), name='privacy_policy_unique_recipient'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_policy_tools', '0015_consent_campaigns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='privacypolicy',
+            name='active_from',
+            field=models.DateTimeField(blank=True, default=None, help_text='Leave empty to activate the policy immediately.', null=True, verbose_name='Active from'),
+        ),
+        migrations.AddField(
+            model_name='privacypolicy',
+            name='active_until',
+            field=models.DateTimeField(blank=True, default=None, help_text='Leave empty to keep the policy active.', null=True, verbose_name='Active until'),
+        ),
+    ]
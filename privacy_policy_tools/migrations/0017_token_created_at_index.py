@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_policy_tools', '0016_policy_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='onetimetoken',
+            index=models.Index(fields=['created_at'], name='privacy_policy_token_time_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:13
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_policy_tools', '0017_token_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingMail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='Subject')),
+                ('body', models.TextField(verbose_name='Body')),
+                ('from_email', models.CharField(max_length=255, verbose_name='From email')),
+                ('recipients', models.JSONField(default=list, verbose_name='Recipients')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Send after')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last error')),
+                ('sent_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Sent at')),
+            ],
+            options={
+                'verbose_name': 'Outgoing Mail',
+                'verbose_name_plural': 'Outgoing Mails',
+                'indexes': [models.Index(fields=['sent_at', 'send_after'], name='privacy_policy_outbox_idx')],
+            },
+        ),
+    ]
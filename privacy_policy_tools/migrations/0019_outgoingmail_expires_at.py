@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_policy_tools', '0018_outgoingmail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outgoingmail',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, default=None, null=True, verbose_name='Expires at'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('privacy_policy_tools', '0019_outgoingmail_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='onetimetoken',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, default=None, null=True, verbose_name='Expires at'),
+        ),
+        migrations.AddIndex(
+            model_name='onetimetoken',
+            index=models.Index(fields=['expires_at'], name='privacy_policy_token_exp_idx'),
+        ),
+    ]
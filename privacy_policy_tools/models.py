@@ -22,9 +22,11 @@
 """
 This module provides the models of the privacy_policy_tools.
 """
-import random
+import secrets
 import string
 
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
 from django.db import models
 from django.contrib.auth.models import Group
 from django.conf import settings
@@ -44,6 +46,10 @@ class PrivacyPolicy(models.Model):
         - active -- true if the policy is active
         - published_at -- date of publishing
         - for_group -- user group
+        - rollout_percentage -- percentage of users who have to confirm
+          the policy
+        - active_from -- date and time the policy becomes active
+        - active_until -- date and time the policy becomes inactive
     """
     title = models.CharField(max_length=128, verbose_name=_('Title'),
                              default=_('Privacy Policy'))
@@ -60,6 +66,19 @@ class PrivacyPolicy(models.Model):
     for_group = models.ForeignKey(Group, on_delete=models.CASCADE,
                                   blank=True, null=True,
                                   verbose_name=_('For group'))
+    rollout_percentage = models.PositiveSmallIntegerField(
+        default=100,
+        validators=[MaxValueValidator(100)],
+        verbose_name=_('Rollout percentage'),
+        help_text=_('Percentage of users who have to confirm the policy. '
+                    'Increase it step by step to spread the confirmations '
+                    'over time.'))
+    active_from = models.DateTimeField(
+        null=True, blank=True, default=None, verbose_name=_('Active from'),
+        help_text=_('Leave empty to activate the policy immediately.'))
+    active_until = models.DateTimeField(
+        null=True, blank=True, default=None, verbose_name=_('Active until'),
+        help_text=_('Leave empty to keep the policy active.'))
 
     def __str__(self):
         """
@@ -67,9 +86,35 @@ class PrivacyPolicy(models.Model):
         """
         return _('Privacy Policy') + ': ' + str(self.published_at)
 
+    def clean(self):
+        """
+        Validates that the policy is active for a timespan.
+        """
+        if self.active_from is not None and self.active_until is not None \
+                and self.active_until <= self.active_from:
+            raise ValidationError({
+                'active_until': _('The end has to be after the start.')})
+
+    def is_active_at(self, moment):
+        """
+        Returns True if the policy is active at the given date and time.
+
+        Keyword arguments:
+            - moment -- date and time
+        """
+        if not self.active:
+            return False
+        if self.active_from is not None and moment < self.active_from:
+            return False
+        return self.active_until is None or moment < self.active_until
+
     class Meta:
         verbose_name = _('Privacy Policy')
         verbose_name_plural = _('Privacy Policies')
+        indexes = [
+            models.Index(fields=['active', 'for_group', '-published_at'],
+                         name='privacy_policy_active_idx'),
+        ]
 
 
 class PrivacyPolicyConfirmation(models.Model):
@@ -97,6 +142,17 @@ class PrivacyPolicyConfirmation(models.Model):
         default=None
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the loaded date of the second confirmation to detect
+        changes when the confirmation is saved.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_second_confirmed_at = instance.__dict__.get(
+            'second_confirmed_at')
+        return instance
+
     def __str__(self):
         """
         Unicode Representation
@@ -106,6 +162,10 @@ class PrivacyPolicyConfirmation(models.Model):
     class Meta:
         verbose_name = _('Privacy Policy Confirmation')
         verbose_name_plural = _('Privacy Policy Confirmations')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'privacy_policy'],
+                                    name='privacy_policy_unique_confirm'),
+        ]
 
 
 class OneTimeToken(models.Model):
@@ -116,6 +176,8 @@ class OneTimeToken(models.Model):
         - token -- token to use
         - created_at -- datetime of token creation
         - confirmation -- confirmation to which the token is related
+        - expires_at -- datetime the token expires, if None it expires
+          SECOND_CONFIRM_VALID_FOR_MINUTES after its creation
     """
     LENGTH = 32
     token = models.CharField(
@@ -127,6 +189,8 @@ class OneTimeToken(models.Model):
     confirmation = models.ForeignKey(PrivacyPolicyConfirmation,
                                      on_delete=models.CASCADE,
                                      verbose_name=_('Confirmation'))
+    expires_at = models.DateTimeField(null=True, blank=True, default=None,
+                                      verbose_name=_('Expires at'))
 
     def __str__(self):
         """
@@ -135,12 +199,13 @@ class OneTimeToken(models.Model):
         return str(self.token)
 
     @classmethod
-    def create_token(cls, confirmation):
+    def create_token(cls, confirmation, expires_at=None):
         """
         Creates a new token.
 
         Args:
             confirmation: confirmation for the token
+            expires_at: datetime the token expires
 
         Returns:
             the created token
@@ -149,7 +214,8 @@ class OneTimeToken(models.Model):
         while cls.objects.filter(token=token,
                                  confirmation=confirmation).exists():
             token = cls._generat_token()
-        ott = cls(token=token, confirmation=confirmation)
+        ott = cls(token=token, confirmation=confirmation,
+                  expires_at=expires_at)
         ott.save()
         return ott
 
@@ -162,10 +228,216 @@ class OneTimeToken(models.Model):
             the token string
         """
         token = ''.join(
-            random.choice(string.ascii_lowercase) for i in range(
+            secrets.choice(string.ascii_lowercase) for i in range(
                 0, cls.LENGTH))
         return token
 
     class Meta:
         verbose_name = _('One Time Token')
         verbose_name_plural = _('One Time Tokens')
+        indexes = [
+            models.Index(fields=['confirmation', 'token'],
+                         name='privacy_policy_token_idx'),
+            models.Index(fields=['created_at'],
+                         name='privacy_policy_token_time_idx'),
+            models.Index(fields=['expires_at'],
+                         name='privacy_policy_token_exp_idx'),
+        ]
+
+
+class PrivacyPolicyCompliance(models.Model):
+    """
+    This model saves which policies are confirmed by a user. It is kept up
+    to date when confirmations are saved or deleted, so the middleware
+    does not have to look at all confirmations of the user.
+
+    Fields:
+        - user -- the user
+        - confirmed_policies -- ids of the confirmed policies
+        - pending_policies -- ids of the confirmed policies without
+          second confirmation
+        - updated_at -- date and time of the last update
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='privacy_policy_compliance',
+                                verbose_name=_('User'))
+    confirmed_policies = models.JSONField(
+        default=list, verbose_name=_('Confirmed policies'))
+    pending_policies = models.JSONField(
+        default=list, verbose_name=_('Policies without second confirmation'))
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name=_('Updated at'))
+
+    def __str__(self):
+        """
+        Unicode Representation
+        """
+        return _('Updated at') + ': ' + str(self.updated_at)
+
+    class Meta:
+        verbose_name = _('Privacy Policy Compliance')
+        verbose_name_plural = _('Privacy Policy Compliances')
+
+
+class PrivacyPolicyStatistics(models.Model):
+    """
+    This model counts the confirmations of a policy. The counters are
+    updated when confirmations are saved or deleted and can be corrected
+    with the command reconcile_statistics.
+
+    Fields:
+        - privacy_policy -- the policy
+        - confirmed_count -- number of confirmations
+        - second_pending_count -- number of confirmations without second
+          confirmation
+        - updated_at -- date and time of the last update
+    """
+    privacy_policy = models.OneToOneField(PrivacyPolicy,
+                                          on_delete=models.CASCADE,
+                                          primary_key=True,
+                                          related_name='statistics',
+                                          verbose_name=_('Privacy Policy'))
+    confirmed_count = models.BigIntegerField(
+        default=0, verbose_name=_('Confirmed'))
+    second_pending_count = models.BigIntegerField(
+        default=0, verbose_name=_('Second confirmation pending'))
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name=_('Updated at'))
+
+    def __str__(self):
+        """
+        Unicode Representation
+        """
+        return _('Updated at') + ': ' + str(self.updated_at)
+
+    class Meta:
+        verbose_name = _('Privacy Policy Statistics')
+        verbose_name_plural = _('Privacy Policy Statistics')
+
+
+class ConsentCampaign(models.Model):
+    """
+    This model represents a campaign to ask users to confirm a new policy.
+
+    Fields:
+        - privacy_policy -- the policy to confirm
+        - created_at -- date and time of creation
+        - total_users -- number of users who have to confirm the policy
+        - notified_users -- number of users who were notified by e-mail
+        - initial_confirmations -- number of confirmations to the policy
+          when the campaign was started
+    """
+    privacy_policy = models.ForeignKey(PrivacyPolicy,
+                                       on_delete=models.CASCADE,
+                                       related_name='campaigns',
+                                       verbose_name=_('Privacy Policy'))
+    created_at = models.DateTimeField(default=timezone.now,
+                                      verbose_name=_('Created at'))
+    total_users = models.BigIntegerField(default=0,
+                                         verbose_name=_('Users'))
+    notified_users = models.BigIntegerField(default=0,
+                                            verbose_name=_('Notified users'))
+    initial_confirmations = models.BigIntegerField(
+        default=0, verbose_name=_('Initial confirmations'))
+
+    def __str__(self):
+        """
+        Unicode Representation
+        """
+        return _('Created at') + ': ' + str(self.created_at)
+
+    class Meta:
+        verbose_name = _('Consent Campaign')
+        verbose_name_plural = _('Consent Campaigns')
+
+
+class ConsentCampaignRecipient(models.Model):
+    """
+    This model saves a user who has to confirm the policy of a campaign.
+
+    Fields:
+        - campaign -- the campaign
+        - user -- the user
+        - notified_at -- date and time of the notification by e-mail
+    """
+    campaign = models.ForeignKey(ConsentCampaign,
+                                 on_delete=models.CASCADE,
+                                 related_name='recipients',
+                                 verbose_name=_('Consent Campaign'))
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,
+                             verbose_name=_('User'))
+    notified_at = models.DateTimeField(null=True, blank=True, default=None,
+                                       verbose_name=_('Notified at'))
+
+    def __str__(self):
+        """
+        Unicode Representation
+        """
+        return str(self.user)
+
+    class Meta:
+        verbose_name = _('Consent Campaign Recipient')
+        verbose_name_plural = _('Consent Campaign Recipients')
+        constraints = [
+            models.UniqueConstraint(fields=['campaign', 'user'],
+                                    name='privacy_policy_unique_recipient'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'notified_at'],
+                         name='privacy_policy_recipient_idx'),
+        ]
+
+
+class OutgoingMail(models.Model):
+    """
+    This model queues an e-mail which is sent by the command
+    send_queued_mail.
+
+    Fields:
+        - subject -- subject of the e-mail
+        - body -- text of the e-mail
+        - from_email -- sender of the e-mail
+        - recipients -- list of receivers of the e-mail
+        - created_at -- date and time the e-mail was queued
+        - send_after -- date and time the next attempt is due
+        - attempts -- number of failed attempts
+        - last_error -- error of the last failed attempt
+        - sent_at -- date and time the e-mail was sent
+        - expires_at -- date and time after which the e-mail is dropped
+          instead of sent, e.g. because its link expired
+    """
+    subject = models.CharField(max_length=255, verbose_name=_('Subject'))
+    body = models.TextField(verbose_name=_('Body'))
+    from_email = models.CharField(max_length=255,
+                                  verbose_name=_('From email'))
+    recipients = models.JSONField(default=list,
+                                  verbose_name=_('Recipients'))
+    created_at = models.DateTimeField(default=timezone.now,
+                                      verbose_name=_('Created at'))
+    send_after = models.DateTimeField(default=timezone.now,
+                                      verbose_name=_('Send after'))
+    attempts = models.PositiveIntegerField(default=0,
+                                           verbose_name=_('Attempts'))
+    last_error = models.TextField(blank=True, default='',
+                                  verbose_name=_('Last error'))
+    sent_at = models.DateTimeField(null=True, blank=True, default=None,
+                                   verbose_name=_('Sent at'))
+    expires_at = models.DateTimeField(null=True, blank=True, default=None,
+                                      verbose_name=_('Expires at'))
+
+    def __str__(self):
+        """
+        Unicode Representation
+        """
+        return str(self.subject)
+
+    class Meta:
+        verbose_name = _('Outgoing Mail')
+        verbose_name_plural = _('Outgoing Mails')
+        indexes = [
+            models.Index(fields=['sent_at', 'send_after'],
+                         name='privacy_policy_outbox_idx'),
+        ]
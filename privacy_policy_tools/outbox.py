@@ -0,0 +1,166 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides a queue of e-mails in the database. The e-mails are
+saved within the transaction of the request and sent later by the command
+send_queued_mail, so requests do not wait for the mail server.
+"""
+
+import datetime
+from smtplib import SMTPException
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from privacy_policy_tools.conf import get_settings
+from privacy_policy_tools.models import OutgoingMail
+from privacy_policy_tools.utils import RateLimiter
+
+# time a worker may need to send a batch before others may retry it
+LEASE = datetime.timedelta(minutes=10)
+# delay of the first retry, doubled for each further attempt
+BACKOFF = datetime.timedelta(minutes=1)
+
+
+def queue_mail(subject, body, from_email, recipients, expires_at=None):
+    """
+    Saves an e-mail to the queue.
+
+    Keyword arguments:
+        - subject -- subject of the e-mail
+        - body -- text of the e-mail
+        - from_email -- sender of the e-mail
+        - recipients -- list of receivers of the e-mail
+        - expires_at -- the e-mail is dropped if it could not be sent
+          before this date and time, None to never drop it
+
+    Returns:
+        the queued mail
+    """
+    return OutgoingMail.objects.create(subject=subject, body=body,
+                                       from_email=from_email,
+                                       recipients=list(recipients),
+                                       expires_at=expires_at)
+
+
+def iter_send_queued_mail(batch_size=100, rate=None):
+    """
+    Sends the e-mails of the queue which are due. All e-mails are sent
+    using a single connection. An e-mail which could not be sent is
+    retried later with an exponential backoff until the number of
+    attempts reaches MAIL_OUTBOX_MAX_ATTEMPTS. Expired e-mails are
+    deleted instead of sent. Each e-mail is marked as sent right after it
+    was handed to the mail server, so it is not sent again if the worker
+    stops in the middle of a batch.
+
+    Keyword arguments:
+        - batch_size -- number of e-mails claimed at once
+        - rate -- e-mails per second, unlimited if None
+
+    Yields:
+        a tuple of the number of sent and failed e-mails for each batch
+    """
+    limiter = RateLimiter(rate)
+    connection = get_connection()
+    delete_expired_mail()
+    with connection:
+        while True:
+            mails = _claim(batch_size)
+            if len(mails) <= 0:
+                break
+            sent = 0
+            failed = 0
+            for mail in mails:
+                limiter.wait()
+                try:
+                    connection.send_messages([EmailMessage(
+                        mail.subject, mail.body, mail.from_email,
+                        mail.recipients, connection=connection)])
+                except Exception as e:
+                    # a single broken e-mail must not stop the worker
+                    _retry_later(mail, e)
+                    if isinstance(e, (SMTPException, OSError)):
+                        _reopen(connection)
+                    failed += 1
+                else:
+                    OutgoingMail.objects.filter(pk=mail.pk).update(
+                        sent_at=timezone.now())
+                    sent += 1
+            yield sent, failed
+
+
+def delete_expired_mail():
+    """
+    Deletes the unsent e-mails which expired, e.g. because the link of a
+    second confirmation is no longer valid.
+
+    Returns:
+        the number of deleted e-mails
+    """
+    return OutgoingMail.objects.filter(
+        sent_at=None, expires_at__lte=timezone.now()).delete()[0]
+
+
+def _claim(batch_size):
+    """
+    Returns due e-mails and postpones them for the time of the lease, so
+    concurrent workers do not send them twice. Rows locked by another
+    worker are skipped if the database supports it.
+    """
+    now = timezone.now()
+    using = router.db_for_write(OutgoingMail)
+    features = connections[using].features
+    with transaction.atomic(using=using):
+        pks = list(OutgoingMail.objects.using(using).select_for_update(
+            skip_locked=features.has_select_for_update_skip_locked
+        ).filter(
+            Q(expires_at=None) | Q(expires_at__gt=now),
+            sent_at=None, send_after__lte=now,
+            attempts__lt=get_settings().MAIL_OUTBOX_MAX_ATTEMPTS
+        ).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        OutgoingMail.objects.using(using).filter(pk__in=pks).update(
+            send_after=now + LEASE)
+    return list(OutgoingMail.objects.using(using).filter(
+        pk__in=pks).order_by('pk'))
+
+
+def _retry_later(mail, error):
+    """
+    Saves a failed attempt and schedules the next one.
+    """
+    OutgoingMail.objects.filter(pk=mail.pk).update(
+        attempts=F('attempts') + 1,
+        last_error=str(error),
+        send_after=timezone.now() + BACKOFF * 2 ** mail.attempts)
+
+
+def _reopen(connection):
+    """
+    Opens a new connection after an error. If the mail server is still
+    unavailable, the next e-mail tries again.
+    """
+    connection.close()
+    try:
+        connection.open()
+    except (SMTPException, OSError):
+        pass
@@ -0,0 +1,117 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides the bulk sending of the e-mails which request a
+second confirmation.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage, get_connection
+from django.urls import reverse
+
+from privacy_policy_tools.conf import get_settings
+from privacy_policy_tools.mail import render_second_confirm_mail
+from privacy_policy_tools.models import OutgoingMail, \
+    PrivacyPolicyConfirmation
+from privacy_policy_tools.tokens import create_tokens, get_expiry
+from privacy_policy_tools.utils import RateLimiter, get_hook
+
+
+def iter_request_second_confirmations(base_url, rate=None, batch_size=100,
+                                      start_after=None, policy_id=None):
+    """
+    Sends an e-mail to request a second confirmation for each confirmation
+    which misses it. The address is returned by the hook
+    SECOND_CONFIRMATION_EMAIL_HOOK, confirmations without an address are
+    skipped. The links are valid for SECOND_CONFIRM_BULK_VALID_FOR_MINUTES,
+    because the e-mails of a large run may be read long after they were
+    sent. The tokens of a batch are created at once and the e-mails are
+    rendered by the mail module. If MAIL_OUTBOX is True the e-mails of a
+    batch are queued at once instead.
+
+    The progress is yielded after each sent e-mail, so a run stopped by
+    an error can be resumed after the last e-mail which was sent.
+
+    Keyword arguments:
+        - base_url -- scheme and host to build the links
+        - rate -- e-mails per second, unlimited if None
+        - batch_size -- number of confirmations loaded at once
+        - start_after -- id of the last confirmation of a previous run
+        - policy_id -- id of a policy to process its confirmations only
+
+    Yields:
+        a tuple of the id of the last processed confirmation and the number
+        of e-mails sent since the last tuple
+    """
+    email_hook = get_hook('SECOND_CONFIRMATION_EMAIL_HOOK')
+    if email_hook is None:
+        raise ImproperlyConfigured(
+            'SECOND_CONFIRMATION_EMAIL_HOOK is not configured.')
+    app_settings = get_settings()
+    valid_for = app_settings.SECOND_CONFIRM_BULK_VALID_FOR_MINUTES
+    # the hook usually reads the user or the policy of the confirmation
+    confirmations = PrivacyPolicyConfirmation.objects.filter(
+        second_confirmed_at=None).select_related(
+        'user', 'privacy_policy').order_by('pk')
+    if policy_id is not None:
+        confirmations = confirmations.filter(privacy_policy_id=policy_id)
+    limiter = RateLimiter(rate)
+    connection = get_connection()
+    with connection:
+        while True:
+            batch = confirmations
+            if start_after is not None:
+                batch = batch.filter(pk__gt=start_after)
+            batch = list(batch[:batch_size])
+            if len(batch) <= 0:
+                break
+            start_after = batch[-1].pk
+            recipients = [(confirmation, email_hook(confirmation))
+                          for confirmation in batch]
+            recipients = [(confirmation, email)
+                          for confirmation, email in recipients if email]
+            tokens = create_tokens([confirmation for confirmation, _
+                                    in recipients], valid_for)
+            expires_at = get_expiry(valid_for)
+            mails = {}
+            for confirmation, email in recipients:
+                confirm_url = base_url.rstrip('/') + reverse(
+                    'privacy_policy_tools.views.second_confirm',
+                    args=(confirmation.pk, tokens[confirmation.pk]))
+                subject, body = render_second_confirm_mail(confirm_url)
+                mails[confirmation.pk] = OutgoingMail(
+                    subject=subject,
+                    body=body,
+                    from_email=app_settings.SECOND_CONFIRM_FROM_EMAIL,
+                    recipients=[email],
+                    expires_at=expires_at)
+            if app_settings.MAIL_OUTBOX:
+                OutgoingMail.objects.bulk_create(mails.values())
+                yield start_after, len(mails)
+                continue
+            for pk, mail in mails.items():
+                limiter.wait()
+                connection.send_messages([EmailMessage(
+                    mail.subject, mail.body, mail.from_email,
+                    mail.recipients, connection=connection)])
+                yield pk, 1
+            # the skipped confirmations at the end of the batch
+            yield start_after, 0
@@ -0,0 +1,193 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides the signal receivers of the privacy_policy_tools.
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Count, Q, QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, \
+    m2m_changed
+from django.dispatch import receiver
+
+from privacy_policy_tools.conf import reset_settings
+from privacy_policy_tools.mail import clear_templates
+from privacy_policy_tools.models import PrivacyPolicy, \
+    PrivacyPolicyConfirmation
+from privacy_policy_tools.utils import bump_policy_version, \
+    clear_compliance, clear_hooks, clear_ignore_pattern, refresh_compliance, \
+    update_statistics
+
+
+@receiver(post_save, sender=PrivacyPolicy)
+@receiver(post_delete, sender=PrivacyPolicy)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_policies(sender, **kwargs):
+    """
+    Invalidates the cached active policies if a policy or a group changes.
+    The version is changed after the commit, so no process caches the old
+    policies under the new version.
+    """
+    transaction.on_commit(bump_policy_version)
+
+
+@receiver(post_save, sender=PrivacyPolicyConfirmation)
+def update_compliance(sender, instance, **kwargs):
+    """
+    Updates the compliance of a user if one of the confirmations is saved.
+    """
+    refresh_compliance(instance.user_id)
+    _clear_compliance_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=PrivacyPolicyConfirmation)
+def count_confirmation(sender, instance, created, **kwargs):
+    """
+    Updates the statistics of the policy if a confirmation is created or
+    its second confirmation changes.
+    """
+    pending = instance.second_confirmed_at is None
+    if created:
+        update_statistics(instance.privacy_policy_id, confirmed=1,
+                          pending=1 if pending else 0)
+    else:
+        was_pending = getattr(instance, '_loaded_second_confirmed_at',
+                              None) is None
+        if pending != was_pending:
+            update_statistics(instance.privacy_policy_id,
+                              pending=1 if pending else -1)
+    instance._loaded_second_confirmed_at = instance.second_confirmed_at
+
+
+@receiver(post_delete, sender=PrivacyPolicyConfirmation)
+def uncount_confirmation(sender, instance, origin=None, **kwargs):
+    """
+    Updates the statistics of the policy if a confirmation is deleted.
+    No statistics are created, because the policy may be deleted.
+    Nothing is done if the policy is deleted, because its statistics are
+    deleted, too. The confirmations of a deleted user are counted by
+    uncount_user_confirmations().
+    """
+    if _deleted_with(origin, PrivacyPolicy) or \
+            _deleted_with(origin, get_user_model()):
+        return
+    pending = instance.second_confirmed_at is None
+    update_statistics(instance.privacy_policy_id, confirmed=-1,
+                      pending=-1 if pending else 0, create=False)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def uncount_user_confirmations(sender, instance, origin=None, **kwargs):
+    """
+    Updates the statistics of the policies confirmed by a deleted user.
+    The confirmations are counted per policy with a single query, so the
+    counters of each policy are changed once.
+    """
+    if not _deleted_with(origin, get_user_model()):
+        return
+    for row in PrivacyPolicyConfirmation.objects.filter(
+            user=instance).order_by().values(
+            'privacy_policy_id').annotate(
+            confirmed=Count('id'),
+            pending=Count('id', filter=Q(second_confirmed_at=None))):
+        update_statistics(row['privacy_policy_id'],
+                          confirmed=-row['confirmed'],
+                          pending=-row['pending'], create=False)
+
+
+@receiver(post_delete, sender=PrivacyPolicyConfirmation)
+def delete_compliance(sender, instance, origin=None, **kwargs):
+    """
+    Updates the compliance of a user if one of the confirmations is
+    deleted. No compliance is created, because the user may be deleted.
+    Nothing is done if the policy or the user is deleted: the compliance
+    of a deleted user is deleted, too, and a deleted policy is never
+    active again.
+    """
+    if _deleted_with(origin, PrivacyPolicy) or \
+            _deleted_with(origin, get_user_model()):
+        return
+    refresh_compliance(instance.user_id, create=False)
+    _clear_compliance_on_commit(instance.user_id)
+
+
+@receiver(post_delete, sender=get_user_model())
+def forget_compliance(sender, instance, **kwargs):
+    """
+    Removes the cached compliance of a deleted user.
+    """
+    _clear_compliance_on_commit(instance.pk)
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def invalidate_group_compliance(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """
+    Invalidates the cached compliance of users whose groups change.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _clear_compliance_on_commit(instance.pk)
+    elif pk_set is not None:
+        for user_id in pk_set:
+            _clear_compliance_on_commit(user_id)
+
+
+def _deleted_with(origin, model):
+    """
+    Returns True if a deletion started by deleting objects of the given
+    model.
+
+    Keyword arguments:
+        - origin -- the model instance or queryset which was deleted
+        - model -- the model class
+    """
+    if isinstance(origin, QuerySet):
+        return issubclass(origin.model, model)
+    return isinstance(origin, model)
+
+
+def _clear_compliance_on_commit(user_id):
+    """
+    Removes the cached compliance of a user after the commit, so no
+    process caches it again from the uncommitted state.
+    """
+    transaction.on_commit(lambda: clear_compliance(user_id))
+
+
+@receiver(setting_changed)
+def reload_settings(sender, setting, **kwargs):
+    """
+    Rebuilds the settings and forgets the imported hooks if the settings
+    of the app change. The e-mail templates are compiled again if the
+    templates change.
+    """
+    if setting == 'PRIVACY_POLICY_TOOLS':
+        reset_settings()
+        clear_hooks()
+        clear_ignore_pattern()
+    if setting in ('PRIVACY_POLICY_TOOLS', 'TEMPLATES'):
+        clear_templates()
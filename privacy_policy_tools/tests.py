@@ -20,5 +20,1132 @@
 # SOFTWARE.
 
 """
-This module provides the tests. Currently there are none.
+This module provides the tests.
 """
+
+import csv
+import datetime
+import gzip
+import json
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone, translation
+from django.utils.http import http_date
+
+from privacy_policy_tools import utils
+from privacy_policy_tools import campaigns, tokens
+from privacy_policy_tools.checks import check_settings
+from privacy_policy_tools.conf import get_settings, reset_settings
+from privacy_policy_tools.context_processors import privacy_tools
+from privacy_policy_tools.middleware import PrivacyPolicyMiddleware
+from privacy_policy_tools.models import OneTimeToken, OutgoingMail, \
+    PrivacyPolicy, PrivacyPolicyCompliance, PrivacyPolicyConfirmation, \
+    PrivacyPolicyStatistics
+from privacy_policy_tools.outbox import iter_send_queued_mail, queue_mail
+from privacy_policy_tools.second_confirmation import \
+    iter_request_second_confirmations
+
+SETTINGS = {
+    'ENABLED': True,
+}
+
+
+def home(request):
+    """
+    View behind the middleware in the tests.
+    """
+    return HttpResponse('home')
+
+
+async def ahome(request):
+    """
+    Async view behind the middleware in the tests.
+    """
+    return HttpResponse('home')
+
+
+urlpatterns = [
+    path('', include('privacy_policy_tools.urls')),
+    path('admin/', admin.site.urls),
+    path('login/', home, name='login'),
+    path('home/', home),
+]
+
+
+@override_settings(PRIVACY_POLICY_TOOLS=SETTINGS,
+                   ROOT_URLCONF='privacy_policy_tools.urls')
+class PolicyTestCase(TestCase):
+    """
+    Base class of the tests. The cached policies are reset for each test,
+    because the database is rolled back after each test.
+    """
+
+    def setUp(self):
+        utils.get_cache().clear()
+        utils._policy_snapshot = (None, [], None, None)
+        utils._fingerprints.clear()
+
+    def create_policy(self, **kwargs):
+        """
+        Creates a policy and runs the callbacks of the commit.
+        """
+        values = {'title': 'Policy', 'text': '<p>Text</p>', 'active': True}
+        values.update(kwargs)
+        with self.captureOnCommitCallbacks(execute=True):
+            return PrivacyPolicy.objects.create(**values)
+
+    def save_policy(self, policy):
+        """
+        Saves a policy and runs the callbacks of the commit.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            policy.save()
+
+
+class SettingsTest(TestCase):
+    """
+    Tests the settings of the app and their system checks.
+    """
+
+    def tearDown(self):
+        reset_settings()
+
+    def check_ids(self, values):
+        # a shared cache, so the warning of LocMemCache is not reported
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with override_settings(PRIVACY_POLICY_TOOLS=values, CACHES=caches):
+            return [error.id for error in check_settings(None)]
+
+    def test_defaults(self):
+        with override_settings(PRIVACY_POLICY_TOOLS={'ENABLED': True}):
+            app_settings = get_settings()
+            self.assertTrue(app_settings.ENABLED)
+            self.assertEqual(app_settings.POLICY_PAGE_URL,
+                             'terms/and/conditions')
+            self.assertEqual(app_settings.IGNORE_URLS, ())
+            with self.assertRaises(AttributeError):
+                app_settings.ENABLED = False
+        self.assertIsNot(get_settings(), app_settings)
+
+    def test_valid_settings(self):
+        self.assertEqual(self.check_ids({
+            'ENABLED': True,
+            'IGNORE_URLS': ['admin', 'prefix:/api/', 'regex:(?i)^/static'],
+            'POLICY_PAGE_CACHE_CONTROL': {'max_age': 60},
+            'CACHE': 'default',
+        }), [])
+
+    def test_invalid_settings(self):
+        for values, error_id in (
+                ([], 'E001'),
+                ({'UNKNOWN': True}, 'W001'),
+                ({'ENABLED': 'yes'}, 'E002'),
+                ({'MAIL_OUTBOX': 1}, 'E002'),
+                ({'COMPLIANCE_CACHE_TIMEOUT': -1}, 'E003'),
+                ({'POLICY_SNAPSHOT_MAX_AGE': True}, 'E003'),
+                ({'POLICY_PAGE_URL': None}, 'E004'),
+                ({'IGNORE_URLS': 'admin'}, 'E005'),
+                ({'IGNORE_URLS': ['regex:(']}, 'E006'),
+                ({'CACHE': 'missing'}, 'E007'),
+                ({'POLICY_PAGE_CACHE_CONTROL': 'public'}, 'E008'),
+                ({'POLICY_PAGE_VARY': 'Cookie'}, 'E009'),
+                ({'SECOND_CONFIRM_TOKEN_BACKEND': 'jwt'}, 'E010')):
+            self.assertEqual(self.check_ids(values),
+                             ['privacy_policy_tools.' + error_id])
+
+    def test_privacy_enabled(self):
+        for values, enabled in (({'ENABLED': True}, True),
+                                ({'ENABLED': False}, False),
+                                ({'ENABLED': None}, None),
+                                ({}, 'terms/and/conditions')):
+            with override_settings(PRIVACY_POLICY_TOOLS=values):
+                self.assertEqual(privacy_tools(None)['privacy_enabled'],
+                                 enabled)
+        with override_settings():
+            del settings.PRIVACY_POLICY_TOOLS
+            reset_settings()
+            self.assertIsNone(privacy_tools(None)['privacy_enabled'])
+
+
+class PathPatternTest(TestCase):
+    """
+    Tests the compiled patterns of the URLs which are not checked.
+    """
+
+    def matches(self, patterns, paths):
+        pattern = utils.compile_path_patterns(patterns)
+        return [pattern.search(path) is not None for path in paths]
+
+    def test_no_patterns(self):
+        self.assertIsNone(utils.compile_path_patterns([]))
+
+    def test_substring(self):
+        self.assertEqual(self.matches(['admin'], [
+            '/admin/', '/x/admin', '/adm']), [True, True, False])
+        # the pattern is no regular expression
+        self.assertEqual(self.matches(['a.c'], ['/a.c', '/abc']),
+                         [True, False])
+
+    def test_prefix(self):
+        self.assertEqual(self.matches(['prefix:/api/'], [
+            '/api/x', '/x/api/']), [True, False])
+
+    def test_exact(self):
+        self.assertEqual(self.matches(['exact:/login/'], [
+            '/login/', '/login/x', '/x/login/', '/login/\n']),
+            [True, False, False, False])
+
+    def test_regex(self):
+        self.assertEqual(self.matches(['regex:^/static/.*\\.css$'], [
+            '/static/a.css', '/static/a.js']), [True, False])
+
+    def test_inline_flags(self):
+        patterns = ['regex:(?i)^/static', 'prefix:/API/']
+        self.assertEqual(self.matches(patterns, [
+            '/STATIC/a.css', '/API/x', '/api/x']), [True, True, False])
+
+    def test_setting_changed(self):
+        with override_settings(PRIVACY_POLICY_TOOLS={
+                'IGNORE_URLS': ['exact:/a/']}):
+            self.assertIsNotNone(utils.get_ignore_pattern().search('/a/'))
+        with override_settings(PRIVACY_POLICY_TOOLS={
+                'IGNORE_URLS': ['exact:/b/']}):
+            self.assertIsNone(utils.get_ignore_pattern().search('/a/'))
+
+
+class HookTest(TestCase):
+    """
+    Tests the registry of the configured hooks.
+    """
+
+    def hook_settings(self, py_path):
+        return override_settings(PRIVACY_POLICY_TOOLS={
+            'SECOND_CONFIRMATION_EMAIL_HOOK': py_path})
+
+    def test_not_configured(self):
+        with override_settings(PRIVACY_POLICY_TOOLS={}):
+            for name in utils.HOOKS:
+                self.assertIsNone(utils.get_hook(name))
+
+    def test_imported_once(self):
+        with self.hook_settings('privacy_policy_tools.tests.'
+                                'confirmation_email'), \
+                mock.patch('privacy_policy_tools.utils.get_by_py_path',
+                           wraps=utils.get_by_py_path) as import_hook:
+            for i in range(2):
+                self.assertIs(
+                    utils.get_hook('SECOND_CONFIRMATION_EMAIL_HOOK'),
+                    confirmation_email)
+        import_hook.assert_called_once()
+
+    def test_invalid_hooks(self):
+        for py_path in ('privacy_policy_tools.tests.missing',
+                        'privacy_policy_tools.missing.hook',
+                        'privacy_policy_tools.tests.SETTINGS'):
+            with self.hook_settings(py_path):
+                with self.assertRaises(ImproperlyConfigured):
+                    utils.load_hooks()
+
+    def test_setting_changed(self):
+        with self.hook_settings('privacy_policy_tools.tests.'
+                                'confirmation_email'):
+            utils.get_hook('SECOND_CONFIRMATION_EMAIL_HOOK')
+        with self.hook_settings('privacy_policy_tools.tests.home'):
+            self.assertIs(utils.get_hook('SECOND_CONFIRMATION_EMAIL_HOOK'),
+                          home)
+
+
+class SnapshotTest(PolicyTestCase):
+    """
+    Tests the snapshot of the active policies kept by each process.
+    """
+
+    def test_reload_on_new_version(self):
+        first = self.create_policy()
+        self.assertEqual(utils.get_active_policies(), [first])
+        with self.assertNumQueries(0):
+            utils.get_active_policies()
+        second = self.create_policy()
+        self.assertEqual(set(utils.get_active_policies()), {first, second})
+
+    def test_reload_after_max_age(self):
+        first = self.create_policy()
+        self.assertEqual(utils.get_active_policies(), [first])
+        # an update sends no signals like a save in another process with
+        # a cache which is not shared
+        PrivacyPolicy.objects.filter(pk=first.pk).update(active=False)
+        self.assertEqual(utils.get_active_policies(), [first])
+        loaded_at = utils._policy_snapshot[3]
+        with mock.patch('time.monotonic', return_value=loaded_at + 60):
+            self.assertEqual(utils.get_active_policies(), [])
+
+    def test_check_local_cache(self):
+        locmem = 'django.core.cache.backends.locmem.LocMemCache'
+        dummy = 'django.core.cache.backends.dummy.DummyCache'
+        for backend, warned in ((locmem, True), (dummy, False)):
+            with override_settings(CACHES={'default': {'BACKEND': backend}}):
+                ids = [error.id for error in check_settings(None)]
+                self.assertEqual('privacy_policy_tools.W002' in ids, warned)
+
+
+@override_settings(ROOT_URLCONF='privacy_policy_tools.tests')
+class MiddlewareTest(PolicyTestCase):
+    """
+    Tests the redirects of the middleware and its cached compliance.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username='user')
+        self.policy = self.create_policy()
+        self.middleware = PrivacyPolicyMiddleware(home)
+
+    def get(self, path='/home/', user=None):
+        request = RequestFactory().get(path)
+        request.user = user or self.user
+        return self.middleware(request)
+
+    def confirm_url(self, next_view='/home/'):
+        return reverse('privacy_policy_tools.views.confirm',
+                       args=(self.policy.pk, next_view))
+
+    def test_redirect(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.confirm_url())
+
+    def test_compliant_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PrivacyPolicyConfirmation.objects.create(
+                user=self.user, privacy_policy=self.policy)
+        self.assertEqual(self.get().status_code, 200)
+        self.assertIsNotNone(utils.get_compliance(self.user))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_ignored_urls(self):
+        with override_settings(PRIVACY_POLICY_TOOLS={
+                'ENABLED': True, 'IGNORE_URLS': ['prefix:/home/']}):
+            self.assertEqual(self.get().status_code, 200)
+            self.assertEqual(self.get('/other/home/').status_code, 302)
+        policy_page = reverse('privacy_policy_tools.views.show')
+        with self.assertNumQueries(0):
+            self.get(policy_page)
+
+    def test_anonymous_user(self):
+        self.assertEqual(self.get(user=AnonymousUser()).status_code, 200)
+
+    def test_disabled(self):
+        with override_settings(PRIVACY_POLICY_TOOLS={'ENABLED': False}):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_next_of_login(self):
+        response = self.get('/login/?next=/home/')
+        self.assertEqual(response['Location'], self.confirm_url())
+        response = self.get('/login/?next=https://example.com/')
+        self.assertEqual(response['Location'],
+                         self.confirm_url(settings.LOGIN_REDIRECT_URL))
+
+
+@override_settings(ROOT_URLCONF='privacy_policy_tools.tests')
+class AsyncMiddlewareTest(PolicyTestCase):
+    """
+    Tests the middleware in front of an async view.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username='user')
+        self.policy = self.create_policy()
+        self.middleware = PrivacyPolicyMiddleware(ahome)
+
+    async def get(self, path='/home/'):
+        request = RequestFactory().get(path)
+        request.user = self.user
+        return await self.middleware(request)
+
+    def test_async_mode(self):
+        self.assertTrue(iscoroutinefunction(self.middleware))
+        self.assertFalse(iscoroutinefunction(PrivacyPolicyMiddleware(home)))
+
+    async def test_redirect(self):
+        response = await self.get()
+        self.assertEqual(response['Location'], reverse(
+            'privacy_policy_tools.views.confirm',
+            args=(self.policy.pk, '/home/')))
+
+    async def test_compliant_user(self):
+        await PrivacyPolicyConfirmation.objects.acreate(
+            user=self.user, privacy_policy=self.policy)
+        self.assertEqual((await self.get()).status_code, 200)
+        self.assertIsNotNone(await utils.aget_compliance(self.user))
+        with mock.patch('privacy_policy_tools.middleware.'
+                        'aget_outstanding_confirmations') as outstanding:
+            self.assertEqual((await self.get()).status_code, 200)
+        outstanding.assert_not_called()
+
+    async def test_async_user(self):
+        async def auser():
+            return AnonymousUser()
+        request = RequestFactory().get('/home/')
+        # the lazy user must not be evaluated in the event loop
+        request.user = mock.NonCallableMock(spec=[])
+        request.auser = auser
+        self.assertEqual((await self.middleware(request)).status_code, 200)
+
+    async def test_ignored_url(self):
+        response = await self.get(reverse('privacy_policy_tools.views.show'))
+        self.assertEqual(response.status_code, 200)
+
+
+class ComplianceTest(PolicyTestCase):
+    """
+    Tests the compliance table and the cached compliance of the users.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create(username='user')
+        self.policy = self.create_policy()
+
+    def confirm(self, user=None, policy=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PrivacyPolicyConfirmation.objects.create(
+                user=user or self.user, privacy_policy=policy or self.policy)
+
+    def confirmed_policies(self, user=None):
+        return PrivacyPolicyCompliance.objects.get(
+            user=user or self.user).confirmed_policies
+
+    def cache_compliance(self):
+        utils.set_compliance(self.user, set(), {self.policy.pk})
+        self.assertIsNotNone(utils.get_compliance(self.user))
+
+    def test_confirmation_saved_and_deleted(self):
+        confirmation = self.confirm()
+        self.assertEqual(self.confirmed_policies(), [self.policy.pk])
+        self.cache_compliance()
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmation.delete()
+        self.assertEqual(self.confirmed_policies(), [])
+        self.assertIsNone(utils.get_compliance(self.user))
+
+    def test_new_policy(self):
+        self.cache_compliance()
+        self.create_policy()
+        self.assertIsNone(utils.get_compliance(self.user))
+
+    def test_group_change(self):
+        self.cache_compliance()
+        group = Group.objects.create(name='group')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(group)
+        self.assertIsNone(utils.get_compliance(self.user))
+        self.cache_compliance()
+        with self.captureOnCommitCallbacks(execute=True):
+            group.user_set.remove(self.user)
+        self.assertIsNone(utils.get_compliance(self.user))
+
+    def test_stale_compliance(self):
+        PrivacyPolicyCompliance.objects.create(user=self.user)
+        # bulk_create sends no signals, like a concurrent request
+        PrivacyPolicyConfirmation.objects.bulk_create([
+            PrivacyPolicyConfirmation(user=self.user,
+                                      privacy_policy=self.policy)])
+        unconfirmed, pending = utils.get_outstanding_confirmations(self.user)
+        self.assertEqual(unconfirmed, set())
+        self.assertEqual(list(pending), [self.policy.pk])
+        self.assertEqual(self.confirmed_policies(), [self.policy.pk])
+
+    def test_outstanding_confirmations(self):
+        policies = [self.policy] + [self.create_policy() for i in range(3)]
+        # bulk_create sends no signals, so the user has no compliance
+        confirmation, = PrivacyPolicyConfirmation.objects.bulk_create([
+            PrivacyPolicyConfirmation(user=self.user,
+                                      privacy_policy=self.policy)])
+        # the compliance and all confirmations of the user
+        with self.assertNumQueries(2):
+            unconfirmed, pending = utils.get_outstanding_confirmations(
+                self.user, policies, set())
+        self.assertEqual(unconfirmed, set(p.pk for p in policies[1:]))
+        self.assertEqual(pending, {self.policy.pk: confirmation})
+        utils.refresh_compliance(self.user.pk)
+        # only the compliance if the pending confirmations are not needed
+        with self.assertNumQueries(1):
+            self.assertEqual(utils.get_outstanding_confirmations(
+                self.user, [self.policy], set(), with_pending=False),
+                (set(), {}))
+
+    def test_save_confirmation(self):
+        confirmed = self.confirm()
+        policy = self.create_policy()
+        with self.captureOnCommitCallbacks(execute=True):
+            saved = utils.save_confirmation(self.user)
+        self.assertEqual([c.privacy_policy_id for c in saved], [policy.pk])
+        self.assertEqual(PrivacyPolicyConfirmation.objects.get(
+            privacy_policy=self.policy), confirmed)
+        self.assertEqual(sorted(self.confirmed_policies()),
+                         [self.policy.pk, policy.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(utils.save_confirmation(self.user), [])
+
+    def test_save_concurrent_confirmation(self):
+        policy = self.create_policy()
+        confirmed = self.confirm()
+        # a concurrent request confirmed the policy after the check
+        outstanding = ({self.policy.pk, policy.pk}, {})
+        with mock.patch(
+                'privacy_policy_tools.utils.get_outstanding_confirmations',
+                return_value=outstanding), \
+                self.captureOnCommitCallbacks(execute=True):
+            saved = utils.save_confirmation(self.user)
+        saved = {c.privacy_policy_id: c for c in saved}
+        self.assertEqual(saved[self.policy.pk], confirmed)
+        self.assertIn(policy.pk, saved)
+        # the confirmation of the concurrent request is counted once
+        self.assertEqual(PrivacyPolicyStatistics.objects.get(
+            privacy_policy=self.policy).confirmed_count, 1)
+
+    def test_missing_policy(self):
+        self.confirm()
+        policy = self.create_policy()
+        unconfirmed, _ = utils.get_outstanding_confirmations(self.user)
+        self.assertEqual(unconfirmed, {policy.pk})
+
+    def test_delete_policy(self):
+        for i in range(20):
+            self.confirm(get_user_model().objects.create(username='u%d' % i))
+        with mock.patch('privacy_policy_tools.signals.refresh_compliance') \
+                as refresh, self.captureOnCommitCallbacks(execute=True):
+            self.policy.delete()
+        refresh.assert_not_called()
+
+    def test_delete_user(self):
+        self.confirm()
+        self.cache_compliance()
+        with mock.patch('privacy_policy_tools.signals.refresh_compliance') \
+                as refresh, self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        refresh.assert_not_called()
+        self.assertFalse(PrivacyPolicyCompliance.objects.exists())
+        self.assertIsNone(get_cache_record(self.user.pk))
+
+    def test_bulk_upsert(self):
+        other = get_user_model().objects.create(username='other')
+        features = connection.features
+        # the database of the tests supports a conflict target, so the
+        # fallback of databases without any support is tested, too
+        for target, conflicts in ((True, True), (False, False)):
+            PrivacyPolicyCompliance.objects.all().delete()
+            PrivacyPolicyCompliance.objects.create(user=self.user)
+            with mock.patch.object(
+                    features, 'supports_update_conflicts_with_target',
+                    target), mock.patch.object(
+                    features, 'supports_update_conflicts', conflicts):
+                utils.bulk_upsert(PrivacyPolicyCompliance, [
+                    PrivacyPolicyCompliance(user=user,
+                                            confirmed_policies=[1])
+                    for user in (self.user, other)
+                ], 'user', ['confirmed_policies', 'updated_at'])
+            self.assertEqual(self.confirmed_policies(), [1])
+            self.assertEqual(self.confirmed_policies(other), [1])
+
+
+def get_cache_record(user_id):
+    """
+    Returns the cached compliance of a user regardless of its version.
+    """
+    return utils.get_cache().get(utils.COMPLIANCE_KEY % user_id)
+
+
+class StatisticsTest(PolicyTestCase):
+    """
+    Tests the counters of the confirmations of each policy.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.policy = self.create_policy()
+        self.users = [get_user_model().objects.create(username='u%d' % i)
+                      for i in range(3)]
+
+    def confirm(self, user, policy=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PrivacyPolicyConfirmation.objects.create(
+                user=user, privacy_policy=policy or self.policy)
+
+    def counters(self, policy=None):
+        return PrivacyPolicyStatistics.objects.filter(
+            privacy_policy=policy or self.policy).values_list(
+            'confirmed_count', 'second_pending_count').first()
+
+    def test_counters(self):
+        confirmations = [self.confirm(user) for user in self.users]
+        self.assertEqual(self.counters(), (3, 3))
+        confirmations[0].second_confirmed_at = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmations[0].save()
+        self.assertEqual(self.counters(), (3, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            confirmations[0].delete()
+            confirmations[1].delete()
+        self.assertEqual(self.counters(), (1, 1))
+
+    def test_counted_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            PrivacyPolicyConfirmation.objects.create(
+                user=self.users[0], privacy_policy=self.policy)
+        self.assertIsNone(self.counters())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.counters(), (1, 1))
+
+    def test_delete_user(self):
+        other = self.create_policy()
+        for user in self.users:
+            self.confirm(user)
+            self.confirm(user, other)
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.users[0].delete()
+        self.assertEqual(self.counters(), (2, 2))
+        self.assertEqual(self.counters(other), (2, 2))
+        self.assertEqual(len([
+            query for query in queries.captured_queries
+            if 'privacypolicystatistics' in query['sql']]), 2)
+
+    def test_delete_policy(self):
+        for i in range(20):
+            self.confirm(get_user_model().objects.create(username='x%d' % i))
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.policy.delete()
+        self.assertLess(len(queries), 10)
+        self.assertFalse(PrivacyPolicyStatistics.objects.exists())
+
+    def test_reconcile_statistics(self):
+        for user in self.users:
+            self.confirm(user)
+        PrivacyPolicyStatistics.objects.update(confirmed_count=10)
+        other = self.create_policy()
+        call_command('reconcile_statistics', stdout=StringIO())
+        self.assertEqual(self.counters(), (3, 3))
+        self.assertEqual(self.counters(other), (0, 0))
+
+
+class ShowTest(PolicyTestCase):
+    """
+    Tests the page showing the active policies.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('privacy_policy_tools.views.show')
+
+    def test_show_active_policies(self):
+        self.create_policy(title='Active policy')
+        self.create_policy(title='Inactive policy', active=False)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Active policy')
+        self.assertNotContains(response, 'Inactive policy')
+
+    def test_show_without_policies(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_etag(self):
+        policy = self.create_policy()
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertTrue(etag)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Accept-Language', response['Vary'])
+        policy.text = '<p>Changed</p>'
+        self.save_policy(policy)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Changed')
+
+    def test_last_modified(self):
+        published_at = timezone.now() - datetime.timedelta(days=1)
+        self.create_policy(published_at=published_at)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Last-Modified'],
+                         http_date(published_at.timestamp()))
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_fingerprint_of_language(self):
+        self.create_policy(text_en='<p>Text</p>', text_de='<p>Inhalt</p>')
+        with translation.override('en'):
+            fingerprint = utils.get_policies_fingerprint()
+        with translation.override('de'):
+            self.assertNotEqual(utils.get_policies_fingerprint(),
+                                fingerprint)
+
+    @override_settings(PRIVACY_POLICY_TOOLS=dict(
+        SETTINGS, POLICY_PAGE_CACHE_CONTROL={'public': True,
+                                             'max_age': 300}))
+    def test_cache_control(self):
+        self.create_policy()
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertIn('max-age=300', response['Cache-Control'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('max-age=300', response['Cache-Control'])
+
+
+@override_settings(ROOT_URLCONF='privacy_policy_tools.tests')
+class ExportTest(PolicyTestCase):
+    """
+    Tests the export of the confirmations for audits.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.policy = self.create_policy()
+        self.staff = get_user_model().objects.create(username='staff',
+                                                     is_staff=True)
+        self.staff.user_permissions.add(Permission.objects.get(
+            codename='view_privacypolicyconfirmation'))
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in (self.staff, get_user_model().objects.create(
+                    username='user')):
+                PrivacyPolicyConfirmation.objects.create(
+                    user=user, privacy_policy=self.policy)
+
+    def export(self, user=None, **params):
+        self.client.force_login(user or self.staff)
+        return self.client.get(
+            reverse('privacy_policy_tools.views.export'), params)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('confirmations.csv', response['Content-Disposition'])
+        rows = list(csv.reader(self.content(response).decode().splitlines()))
+        self.assertEqual(rows[0][:3], ['id', 'user_id', 'username'])
+        self.assertEqual([row[2] for row in rows[1:]], ['staff', 'user'])
+        self.assertEqual(rows[1][4], 'Policy')
+
+    def test_jsonl(self):
+        response = self.export(format='jsonl')
+        rows = [json.loads(line)
+                for line in self.content(response).splitlines()]
+        self.assertEqual([row['username'] for row in rows], ['staff', 'user'])
+        self.assertEqual(rows[0]['policy_id'], self.policy.pk)
+        self.assertIsNone(rows[0]['second_confirmed_at'])
+
+    def test_gzip(self):
+        response = self.export(format='jsonl', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('confirmations.jsonl.gz',
+                      response['Content-Disposition'])
+        lines = gzip.decompress(self.content(response)).splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.export(format='xml').status_code, 404)
+
+    def test_permissions(self):
+        self.staff.user_permissions.clear()
+        self.assertEqual(self.export().status_code, 403)
+        user = get_user_model().objects.get(username='user')
+        self.assertEqual(self.export(user).status_code, 302)
+
+
+class ScheduleTest(PolicyTestCase):
+    """
+    Tests the scheduled activation and deactivation of policies.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+
+    def at(self, minutes):
+        """
+        Returns a patch of the current time.
+        """
+        return mock.patch('django.utils.timezone.now', return_value=(
+            self.now + datetime.timedelta(minutes=minutes)))
+
+    def active_ids(self):
+        return [policy.pk for policy in utils.get_active_policies()]
+
+    def test_activation(self):
+        policy = self.create_policy(
+            active_from=self.now + datetime.timedelta(minutes=10))
+        with self.at(0):
+            self.assertEqual(self.active_ids(), [])
+            version = utils.get_policy_version()
+        with self.at(5), self.assertNumQueries(0):
+            self.assertEqual(self.active_ids(), [])
+        with self.at(10):
+            self.assertEqual(self.active_ids(), [policy.pk])
+            self.assertNotEqual(utils.get_policy_version(), version)
+            self.assertIsNone(utils._policy_snapshot[2])
+
+    def test_deactivation(self):
+        policy = self.create_policy(
+            active_until=self.now + datetime.timedelta(minutes=10))
+        with self.at(0):
+            self.assertEqual(self.active_ids(), [policy.pk])
+        with self.at(11):
+            self.assertEqual(self.active_ids(), [])
+
+    def test_version_changes_once_per_transition(self):
+        self.create_policy(
+            active_from=self.now + datetime.timedelta(minutes=10))
+        with self.at(0):
+            self.active_ids()
+            snapshot = utils._policy_snapshot
+        with self.at(10):
+            self.active_ids()
+            version = utils.get_policy_version()
+            # another process still holds the snapshot before the transition
+            utils._policy_snapshot = snapshot
+            self.active_ids()
+            self.assertEqual(utils.get_policy_version(), version)
+
+    def test_next_transition(self):
+        self.create_policy(
+            active_from=self.now + datetime.timedelta(minutes=10),
+            active_until=self.now + datetime.timedelta(minutes=20))
+        with self.at(0):
+            self.active_ids()
+            self.assertEqual(utils._policy_snapshot[2],
+                             self.now + datetime.timedelta(minutes=10))
+        with self.at(15):
+            self.active_ids()
+            self.assertEqual(utils._policy_snapshot[2],
+                             self.now + datetime.timedelta(minutes=20))
+
+    async def test_async_activation(self):
+        policy = await PrivacyPolicy.objects.acreate(
+            title='Policy', text='Text', active=True,
+            active_from=self.now + datetime.timedelta(minutes=10))
+        with self.at(0):
+            self.assertEqual(await utils.aget_active_policies(), [])
+        with self.at(10):
+            policies = await utils.aget_active_policies()
+            self.assertEqual([p.pk for p in policies], [policy.pk])
+
+    def test_show_page(self):
+        self.create_policy(
+            title='Scheduled policy',
+            active_from=self.now + datetime.timedelta(minutes=10))
+        url = reverse('privacy_policy_tools.views.show')
+        with self.at(0):
+            response = self.client.get(url)
+            self.assertNotContains(response, 'Scheduled policy')
+            etag = response['ETag']
+        with self.at(10):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Scheduled policy')
+
+
+class OutboxTest(TestCase):
+    """
+    Tests the sending of the queued e-mails.
+    """
+
+    def send(self):
+        sent = 0
+        failed = 0
+        for batch_sent, batch_failed in iter_send_queued_mail():
+            sent += batch_sent
+            failed += batch_failed
+        return sent, failed
+
+    def test_send(self):
+        queued = queue_mail('Subject', 'Body', 'from@example.com',
+                            ['to@example.com'])
+        self.assertEqual(self.send(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        queued.refresh_from_db()
+        self.assertIsNotNone(queued.sent_at)
+        self.assertEqual(self.send(), (0, 0))
+
+    def test_broken_mail(self):
+        # line breaks in the subject raise BadHeaderError
+        broken = queue_mail('Broken\nSubject', 'Body', 'from@example.com',
+                            ['to@example.com'])
+        queue_mail('Subject', 'Body', 'from@example.com', ['to@example.com'])
+        self.assertEqual(self.send(), (1, 1))
+        broken.refresh_from_db()
+        self.assertIsNone(broken.sent_at)
+        self.assertEqual(broken.attempts, 1)
+        self.assertTrue(broken.last_error)
+
+    def test_expired_mail(self):
+        queue_mail('Expired', 'Body', 'from@example.com', ['to@example.com'],
+                   expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        queue_mail('Valid', 'Body', 'from@example.com', ['to@example.com'],
+                   expires_at=timezone.now() + datetime.timedelta(minutes=10))
+        self.assertEqual(self.send(), (1, 0))
+        self.assertEqual([m.subject for m in mail.outbox], ['Valid'])
+        self.assertFalse(OutgoingMail.objects.filter(
+            subject='Expired').exists())
+
+
+class TokenTest(TestCase):
+    """
+    Tests the tokens of the links to the second confirmation.
+    """
+
+    def setUp(self):
+        user = get_user_model().objects.create(username='user')
+        policy = PrivacyPolicy.objects.create(title='Policy', text='Text')
+        self.confirmation = PrivacyPolicyConfirmation.objects.create(
+            user=user, privacy_policy=policy)
+        self.now = timezone.now()
+
+    def after(self, minutes):
+        """
+        Returns a patch of the current time.
+        """
+        return mock.patch('django.utils.timezone.now', return_value=(
+            self.now + datetime.timedelta(minutes=minutes)))
+
+    def assert_validity(self, token, minutes):
+        with self.after(minutes - 1):
+            self.assertTrue(tokens.check_token(self.confirmation, token))
+        with self.after(minutes + 2):
+            self.assertFalse(tokens.check_token(self.confirmation, token))
+
+    def test_db_token(self):
+        with self.after(0):
+            token = tokens.create_token(self.confirmation)
+        self.assert_validity(token, 10)
+
+    def test_db_bulk_token(self):
+        with self.after(0):
+            token = tokens.create_tokens([self.confirmation], 600)[
+                self.confirmation.pk]
+        self.assert_validity(token, 600)
+
+    def test_db_token_without_expiry(self):
+        with self.after(0):
+            token = tokens.create_token(self.confirmation)
+        OneTimeToken.objects.update(expires_at=None)
+        self.assert_validity(token, 10)
+
+    def test_delete_expired_tokens(self):
+        with self.after(0):
+            tokens.create_token(self.confirmation)
+            tokens.create_tokens([self.confirmation], 600)
+            tokens.create_token(self.confirmation)
+        OneTimeToken.objects.filter(pk=OneTimeToken.objects.last().pk).update(
+            expires_at=None)
+        with self.after(20):
+            self.assertEqual(tokens.delete_expired_tokens(), 2)
+        self.assertEqual(OneTimeToken.objects.count(), 1)
+
+    @override_settings(PRIVACY_POLICY_TOOLS={
+        'SECOND_CONFIRM_TOKEN_BACKEND': 'signed'})
+    def test_signed_token(self):
+        with mock.patch('time.time', return_value=self.now.timestamp()):
+            token = tokens.create_token(self.confirmation)
+            bulk_token = tokens.create_tokens([self.confirmation], 600)[
+                self.confirmation.pk]
+            legacy_token = tokens._signer().sign(str(self.confirmation.pk))
+        for minutes, valid in ((9, (True, True, True)),
+                               (12, (False, True, False)),
+                               (602, (False, False, False))):
+            now = self.now + datetime.timedelta(minutes=minutes)
+            with mock.patch('time.time', return_value=now.timestamp()):
+                self.assertEqual(tuple(
+                    tokens.check_token(self.confirmation, t)
+                    for t in (token, bulk_token, legacy_token)), valid)
+
+    @override_settings(PRIVACY_POLICY_TOOLS={
+        'SECOND_CONFIRM_TOKEN_BACKEND': 'signed'})
+    def test_signed_token_of_other_confirmation(self):
+        token = tokens._signer().sign('%s:10' % (self.confirmation.pk + 1))
+        self.assertFalse(tokens.check_token(self.confirmation, token))
+        self.assertFalse(tokens.check_token(self.confirmation, 'broken'))
+
+
+class CampaignTest(PolicyTestCase):
+    """
+    Tests the e-mails of the consent campaigns.
+    """
+
+    def test_subject_of_policy(self):
+        get_user_model().objects.create(username='user',
+                                        email='user@example.com')
+
+        def render(template_name, context=None, *args, **kwargs):
+            return 'Confirm\n%s' % context['policy'].title
+
+        with mock.patch('privacy_policy_tools.mail.render_to_string',
+                        side_effect=render):
+            for title in ('First policy', 'Second policy'):
+                policy = self.create_policy(title=title)
+                campaign = campaigns.start_campaign(policy)
+                list(campaigns.notify_recipients(campaign,
+                                                 'https://example.com'))
+        self.assertEqual([m.subject for m in mail.outbox],
+                         ['Confirm First policy', 'Confirm Second policy'])
+
+    def start(self, users=3):
+        for i in range(users):
+            get_user_model().objects.create(username='user%d' % i,
+                                            email='user%d@example.com' % i)
+        self.policy = self.create_policy()
+        return campaigns.start_campaign(self.policy)
+
+    def notify(self, campaign, batch_size=100):
+        return sum(campaigns.notify_recipients(
+            campaign, 'https://example.com', batch_size=batch_size))
+
+    def test_notify(self):
+        campaign = self.start()
+        self.assertEqual(self.notify(campaign, batch_size=2), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('/%d' % self.policy.pk, mail.outbox[0].body)
+        self.assertEqual(self.notify(campaign), 0)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.notified_users, 3)
+
+    def test_error_during_batch(self):
+        campaign = self.start()
+        send_messages = mail.get_connection().__class__.send_messages
+        calls = []
+
+        def fail_second(backend, messages):
+            calls.append(messages)
+            if len(calls) == 2:
+                raise SMTPException('unavailable')
+            return send_messages(backend, messages)
+
+        with mock.patch.object(mail.get_connection().__class__,
+                               'send_messages', fail_second), \
+                self.assertRaises(SMTPException):
+            self.notify(campaign)
+        self.assertEqual(campaign.recipients.exclude(
+            notified_at=None).count(), 1)
+        self.assertEqual(self.notify(campaign), 2)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['user%d@example.com' % i for i in range(3)])
+
+    @override_settings(PRIVACY_POLICY_TOOLS={'MAIL_OUTBOX': True})
+    def test_outbox(self):
+        campaign = self.start()
+        self.assertEqual(self.notify(campaign), 3)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingMail.objects.count(), 3)
+        self.assertEqual(self.notify(campaign), 0)
+        self.assertEqual(campaign.recipients.filter(
+            notified_at=None).count(), 0)
+
+    def test_german_subject(self):
+        campaign = self.start(1)
+        with translation.override('de'):
+            self.notify(campaign)
+        self.assertEqual(mail.outbox[0].subject, 'Bitte stimmen Sie '
+                         'unserer aktualisierten Datenschutzerklärung zu')
+
+
+def confirmation_email(confirmation):
+    """
+    Returns the e-mail of the user of a confirmation for the tests.
+    """
+    return confirmation.user.email
+
+
+@override_settings(PRIVACY_POLICY_TOOLS={
+    'SECOND_CONFIRMATION_EMAIL_HOOK':
+        'privacy_policy_tools.tests.confirmation_email'},
+    ROOT_URLCONF='privacy_policy_tools.urls')
+class RequestSecondConfirmationsTest(TestCase):
+    """
+    Tests requesting the missing second confirmations in bulk.
+    """
+
+    def setUp(self):
+        policy = PrivacyPolicy.objects.create(title='Policy', text='Text')
+        self.confirmations = [
+            PrivacyPolicyConfirmation.objects.create(
+                user=get_user_model().objects.create(
+                    username='user%d' % i,
+                    email='user%d@example.com' % i if i != 1 else ''),
+                privacy_policy=policy)
+            for i in range(4)]
+
+    def request(self, start_after=None):
+        progress = []
+        for last_pk, sent in iter_request_second_confirmations(
+                'https://example.com', start_after=start_after):
+            progress.append((last_pk, sent))
+        return progress
+
+    def test_request(self):
+        # the batch with users and policies, the tokens and the end
+        with self.assertNumQueries(3):
+            progress = self.request()
+        self.assertEqual(sum(sent for _, sent in progress), 3)
+        self.assertEqual(progress[-1][0], self.confirmations[-1].pk)
+        self.assertEqual([m.to for m in mail.outbox], [
+            ['user0@example.com'], ['user2@example.com'],
+            ['user3@example.com']])
+        token = OneTimeToken.objects.first()
+        self.assertGreater(token.expires_at - timezone.now(),
+                           datetime.timedelta(days=6))
+
+    def test_resume_after_error(self):
+        backend = mail.get_connection().__class__
+        send_messages = backend.send_messages
+
+        def fail_second(connection, messages):
+            if len(mail.outbox) >= 1:
+                raise SMTPException('unavailable')
+            return send_messages(connection, messages)
+
+        progress = []
+        with mock.patch.object(backend, 'send_messages', fail_second), \
+                self.assertRaises(SMTPException):
+            for item in iter_request_second_confirmations(
+                    'https://example.com'):
+                progress.append(item)
+        self.assertEqual(progress, [(self.confirmations[0].pk, 1)])
+        self.request(progress[-1][0])
+        self.assertEqual([m.to for m in mail.outbox], [
+            ['user0@example.com'], ['user2@example.com'],
+            ['user3@example.com']])
+
+    def test_outbox(self):
+        with override_settings(PRIVACY_POLICY_TOOLS=dict(
+                settings.PRIVACY_POLICY_TOOLS, MAIL_OUTBOX=True)):
+            progress = self.request()
+        self.assertEqual(progress, [(self.confirmations[-1].pk, 3)])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingMail.objects.exclude(
+            expires_at=None).count(), 3)
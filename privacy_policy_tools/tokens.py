@@ -0,0 +1,218 @@
+# Copyright (c) 2022-2023 Josef Wachtler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+This module provides the tokens of the links to the second confirmation.
+
+Two backends are supported, configured by SECOND_CONFIRM_TOKEN_BACKEND:
+    - db -- a random token is saved in the table of OneTimeToken
+    - signed -- the id of the confirmation is signed with a timestamp, so
+      no token has to be saved and checking it needs no database query
+"""
+
+import datetime
+
+from django.core import signing
+from django.utils import timezone
+
+from privacy_policy_tools.conf import get_settings
+from privacy_policy_tools.models import OneTimeToken
+
+TOKEN_BACKENDS = ('db', 'signed')
+SALT = 'privacy_policy_tools.second_confirm'
+
+
+def create_token(confirmation, valid_for=None):
+    """
+    Creates a token for the link to the second confirmation.
+
+    Keyword arguments:
+        - confirmation -- confirmation waiting for a second confirmation
+        - valid_for -- minutes the token is valid, defaults to
+          SECOND_CONFIRM_VALID_FOR_MINUTES
+
+    Returns:
+        the token string
+    """
+    if valid_for is None:
+        valid_for = get_settings().SECOND_CONFIRM_VALID_FOR_MINUTES
+    if get_settings().SECOND_CONFIRM_TOKEN_BACKEND == 'signed':
+        return _signer().sign(_signed_value(confirmation, valid_for))
+    return OneTimeToken.create_token(confirmation,
+                                     get_expiry(valid_for)).token
+
+
+def create_tokens(confirmations, valid_for=None):
+    """
+    Creates the tokens for many confirmations at once.
+
+    Keyword arguments:
+        - confirmations -- list of confirmations
+        - valid_for -- minutes the tokens are valid, defaults to
+          SECOND_CONFIRM_VALID_FOR_MINUTES
+
+    Returns:
+        a dict mapping the ids of the confirmations to the token strings
+    """
+    if valid_for is None:
+        valid_for = get_settings().SECOND_CONFIRM_VALID_FOR_MINUTES
+    if get_settings().SECOND_CONFIRM_TOKEN_BACKEND == 'signed':
+        signer = _signer()
+        return {confirmation.pk: signer.sign(
+            _signed_value(confirmation, valid_for))
+            for confirmation in confirmations}
+    expires_at = get_expiry(valid_for)
+    tokens = [OneTimeToken(token=OneTimeToken._generat_token(),
+                           confirmation=confirmation, expires_at=expires_at)
+              for confirmation in confirmations]
+    OneTimeToken.objects.bulk_create(tokens)
+    return {token.confirmation_id: token.token for token in tokens}
+
+
+def get_expiry(valid_for=None):
+    """
+    Returns the date and time at which a token created now expires.
+
+    Keyword arguments:
+        - valid_for -- minutes the token is valid, defaults to
+          SECOND_CONFIRM_VALID_FOR_MINUTES
+    """
+    if valid_for is None:
+        valid_for = get_settings().SECOND_CONFIRM_VALID_FOR_MINUTES
+    return timezone.now() + datetime.timedelta(minutes=valid_for)
+
+
+def check_token(confirmation, token):
+    """
+    Returns True if the token is valid for the confirmation and has not
+    expired. A token is only valid as long as the second confirmation is
+    missing, so every token can be used once.
+
+    Keyword arguments:
+        - confirmation -- confirmation waiting for a second confirmation
+        - token -- token string of the link
+    """
+    if confirmation.second_confirmed_at is not None:
+        return False
+    valid_for = get_settings().SECOND_CONFIRM_VALID_FOR_MINUTES
+    if get_settings().SECOND_CONFIRM_TOKEN_BACKEND == 'signed':
+        signer = _signer()
+        try:
+            value = signer.unsign(token)
+            # tokens signed without a validity use the default one
+            pk, _, minutes = value.partition(':')
+            if minutes:
+                valid_for = int(minutes)
+            signer.unsign(token, max_age=valid_for * 60)
+        except (signing.BadSignature, ValueError):
+            return False
+        return pk == str(confirmation.pk)
+    tokens = OneTimeToken.objects.filter(confirmation=confirmation,
+                                         token=token)
+    if len(tokens) != 1:
+        return False
+    if tokens[0].expires_at is not None:
+        return timezone.now() <= tokens[0].expires_at
+    delta = timezone.now() - tokens[0].created_at
+    return int(delta.total_seconds() / 60) <= valid_for
+
+
+def delete_token(confirmation, token):
+    """
+    Deletes a used token. Signed tokens are not saved, so there is nothing
+    to delete.
+
+    Keyword arguments:
+        - confirmation -- confirmation of the token
+        - token -- token string of the link
+    """
+    if get_settings().SECOND_CONFIRM_TOKEN_BACKEND != 'signed':
+        OneTimeToken.objects.filter(confirmation=confirmation,
+                                    token=token).delete()
+
+
+def delete_expired_tokens(batch_size=1000):
+    """
+    Deletes the saved tokens which have expired. The tokens are deleted in
+    batches by ranges of their primary key, so every delete is short and
+    locks a few rows only. It may be called periodically, e.g. by a task
+    queue.
+
+    Keyword arguments:
+        - batch_size -- maximum number of tokens deleted at once
+
+    Returns:
+        the number of deleted tokens
+    """
+    return sum(iter_delete_expired_tokens(batch_size))
+
+
+def iter_delete_expired_tokens(batch_size=1000):
+    """
+    Deletes the expired tokens like delete_expired_tokens() and yields the
+    number of tokens deleted by each batch.
+
+    Keyword arguments:
+        - batch_size -- maximum number of tokens deleted at once
+    """
+    valid_for = get_settings().SECOND_CONFIRM_VALID_FOR_MINUTES
+    # a token without expires_at is valid until its age exceeds valid_for
+    # whole minutes
+    expired_before = timezone.now() - datetime.timedelta(
+        minutes=valid_for + 1)
+    yield from _iter_delete(OneTimeToken.objects.filter(
+        expires_at=None, created_at__lt=expired_before), batch_size)
+    yield from _iter_delete(OneTimeToken.objects.filter(
+        expires_at__lt=timezone.now()), batch_size)
+
+
+def _iter_delete(expired, batch_size):
+    """
+    Deletes the tokens of a query in batches by ranges of their primary
+    key and yields the number of tokens deleted by each batch.
+    """
+    expired = expired.order_by('pk')
+    last_pk = None
+    while True:
+        batch = expired
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if len(pks) <= 0:
+            break
+        deleted, _ = expired.filter(pk__gte=pks[0],
+                                    pk__lte=pks[-1]).delete()
+        last_pk = pks[-1]
+        yield deleted
+
+
+def _signed_value(confirmation, valid_for):
+    """
+    Returns the signed value of a token. The validity is part of it, so a
+    token keeps the validity it was created with.
+    """
+    return '%s:%s' % (confirmation.pk, valid_for)
+
+
+def _signer():
+    """
+    Returns the signer of the tokens.
+    """
+    return signing.TimestampSigner(salt=SALT)
@@ -23,16 +23,16 @@ This module designs the urls of the package privacy_policy_tools.
 """
 
 from django.urls import re_path
-from privacy_policy_tools.utils import get_setting
+from privacy_policy_tools.conf import get_settings
 from privacy_policy_tools.views import confirm, show, \
-    second_confirm_required, second_confirm
+    second_confirm_required, second_confirm, export
 
-confirm_url = get_setting('POLICY_CONFIRM_URL')
-page_url = get_setting('POLICY_PAGE_URL')
-second_confirm_required_url = get_setting('SECOND_CONFIRM_REQUIRED_URL',
-                                          'confirm/second/required')
-second_confirm_url = get_setting('SECOND_CONFIRM_URL',
-                                 'confirm/second')
+app_settings = get_settings()
+confirm_url = app_settings.POLICY_CONFIRM_URL
+page_url = app_settings.POLICY_PAGE_URL
+second_confirm_required_url = app_settings.SECOND_CONFIRM_REQUIRED_URL
+second_confirm_url = app_settings.SECOND_CONFIRM_URL
+export_url = app_settings.EXPORT_URL
 
 urlpatterns = [
     re_path(r'^' + page_url + r'$',
@@ -45,6 +45,8 @@ urlpatterns = [
             second_confirm_required,
             name='privacy_policy_tools.views.second_confirm_required'),
     re_path(r'^' + second_confirm_url + r'/(?P<confirm_id>[0-9]+)/next('
-                                        r'?P<token>[a-z]+)$',
+                                        r'?P<token>[A-Za-z0-9_\-:]+)$',
             second_confirm, name='privacy_policy_tools.views.second_confirm'),
+    re_path(r'^' + export_url + r'$',
+            export, name='privacy_policy_tools.views.export'),
 ]
@@ -23,13 +23,26 @@
 This module provides some helper functions of the privacy_policy_tools.
 """
 
+import hashlib
+import re
+import time
+import zlib
+
+from asgiref.sync import sync_to_async
+
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router, transaction
+from django.db.models import F, Q
 from django.http import Http404
 from django.utils import timezone
+from django.utils.translation import get_language
 
+from privacy_policy_tools.conf import get_settings
 from privacy_policy_tools.models import PrivacyPolicy, \
-    PrivacyPolicyConfirmation
+    PrivacyPolicyConfirmation, PrivacyPolicyCompliance, \
+    PrivacyPolicyStatistics
 
 
 def get_by_py_path(py_path):
@@ -47,26 +60,340 @@ def get_by_py_path(py_path):
     return m
 
 
-def get_active_policies():
+POLICY_VERSION_KEY = 'privacy_policy_tools.policy_version'
+COMPLIANCE_KEY = 'privacy_policy_tools.compliance.%s'
+TRANSITION_KEY = 'privacy_policy_tools.transition.%s'
+
+_policy_snapshot = (None, [], None, None)
+_ignore_pattern = None
+INLINE_FLAGS = re.compile(r'^\(\?([aiLmsux]+)\)')
+_fingerprints = {}
+
+
+def get_cache():
     """
-    Returns a list of active policies.
+    Returns the cache used to share state between processes.
+    """
+    return caches[get_settings().CACHE]
+
+
+def get_policy_version():
+    """
+    Returns the current version of the set of active policies.
+
+    If the version is missing in the cache (e.g. because it was evicted)
+    a new one is created from the current time, so that outdated
+    snapshots are never mistaken for the current one.
+    """
+    cache = get_cache()
+    version = cache.get(POLICY_VERSION_KEY)
+    if version is None:
+        cache.add(POLICY_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(POLICY_VERSION_KEY)
+    return version
+
+
+def bump_policy_version():
+    """
+    Invalidates the snapshots of active policies in all processes.
     """
-    policies = []
+    cache = get_cache()
     try:
-        nogroup = PrivacyPolicy.objects.filter(
-            for_group=None, active=True).order_by('-published_at')
-        policies.extend(nogroup)
-    except PrivacyPolicy.DoesNotExist:
+        cache.incr(POLICY_VERSION_KEY)
+    except ValueError:
+        cache.set(POLICY_VERSION_KEY, time.time_ns(), None)
+
+
+async def abump_policy_version():
+    """
+    Async version of bump_policy_version().
+    """
+    cache = get_cache()
+    try:
+        await cache.aincr(POLICY_VERSION_KEY)
+    except ValueError:
+        await cache.aset(POLICY_VERSION_KEY, time.time_ns(), None)
+
+
+async def aget_policy_version():
+    """
+    Async version of get_policy_version().
+    """
+    cache = get_cache()
+    version = await cache.aget(POLICY_VERSION_KEY)
+    if version is None:
+        await cache.aadd(POLICY_VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(POLICY_VERSION_KEY)
+    return version
+
+
+HOOKS = (
+    'START_HOOK',
+    'SECOND_CONFIRMATION_REQUIRED_HOOK',
+    'SECOND_CONFIRMATION_GET_EMAIL_HOOK',
+    'SECOND_CONFIRMATION_SAVE_EMAIL_HOOK',
+    'SECOND_CONFIRMATION_EMAIL_HOOK',
+)
+
+_hooks = {}
+
+
+def get_hook(name):
+    """
+    Returns the callable configured for a hook or None if the hook is not
+    configured. The callable is imported only once.
+
+    Keyword arguments:
+        - name -- name of the setting of the hook
+    """
+    try:
+        return _hooks[name]
+    except KeyError:
         pass
-    groups = Group.objects.all().order_by('name')
-    for group in groups:
+    py_path = getattr(get_settings(), name)
+    hook = None
+    if py_path is not None:
         try:
-            active = group.privacypolicy_set.filter(
-                active=True).order_by('-published_at')
-            policies.extend(active)
-        except PrivacyPolicy.DoesNotExist:
-            pass
-    return policies
+            hook = get_by_py_path(py_path)
+        except (ImportError, AttributeError, ValueError) as e:
+            raise ImproperlyConfigured(
+                '%s: could not import %s (%s)' % (name, py_path, e))
+        if not callable(hook):
+            raise ImproperlyConfigured(
+                '%s: %s is not callable' % (name, py_path))
+    _hooks[name] = hook
+    return hook
+
+
+def load_hooks():
+    """
+    Imports all configured hooks. Raises ImproperlyConfigured if a hook
+    could not be imported.
+    """
+    for name in HOOKS:
+        get_hook(name)
+
+
+def clear_hooks():
+    """
+    Forgets the imported hooks, e.g. if the settings changed.
+    """
+    _hooks.clear()
+
+
+def compile_path_patterns(patterns):
+    """
+    Compiles a list of URL patterns into a single regular expression.
+
+    A pattern matches if the path contains it. Patterns may be prefixed
+    to change this behaviour:
+        - prefix: -- the path starts with the pattern
+        - exact: -- the path is equal to the pattern
+        - regex: -- the regular expression is found in the path
+
+    Inline flags at the start of a regular expression, e.g. (?i), are
+    applied to this expression only.
+
+    Keyword arguments:
+        - patterns -- list of patterns
+
+    Returns:
+        the compiled regular expression or None if there are no patterns
+    """
+    parts = []
+    for pattern in patterns:
+        if pattern.startswith('prefix:'):
+            parts.append('^' + re.escape(pattern[len('prefix:'):]))
+        elif pattern.startswith('exact:'):
+            parts.append('^' + re.escape(pattern[len('exact:'):]) + r'\Z')
+        elif pattern.startswith('regex:'):
+            parts.append(_scoped_regex(pattern[len('regex:'):]))
+        else:
+            parts.append(re.escape(pattern))
+    if len(parts) <= 0:
+        return None
+    return re.compile('|'.join(parts))
+
+
+def _scoped_regex(regex):
+    """
+    Returns a regular expression as a group which can be combined with
+    others. Global inline flags are turned into flags of the group.
+    """
+    flags = INLINE_FLAGS.match(regex)
+    if flags is not None:
+        return '(?%s:%s)' % (flags.group(1), regex[flags.end():])
+    return '(?:' + regex + ')'
+
+
+def get_ignore_pattern():
+    """
+    Returns the compiled pattern of the URLs which are not checked by the
+    middleware. It is compiled once from the settings.
+    """
+    global _ignore_pattern
+    if _ignore_pattern is None:
+        app_settings = get_settings()
+        patterns = [app_settings.POLICY_PAGE_URL]
+        patterns.extend(app_settings.IGNORE_URLS)
+        _ignore_pattern = (compile_path_patterns(patterns), )
+    return _ignore_pattern[0]
+
+
+def clear_ignore_pattern():
+    """
+    Forgets the compiled pattern of the ignored URLs, e.g. if the settings
+    changed.
+    """
+    global _ignore_pattern
+    _ignore_pattern = None
+
+
+def get_active_policies():
+    """
+    Returns a list of active policies.
+
+    The policies are loaded from the database only if the policy version
+    has changed since the last call. Otherwise a process local snapshot
+    is returned. The snapshot knows when the next scheduled policy starts
+    or ends and is reloaded at this moment. It is also reloaded after
+    POLICY_SNAPSHOT_MAX_AGE seconds, in case the cache is not shared
+    between the processes.
+    """
+    return list(_get_policy_snapshot()[1])
+
+
+def _get_policy_snapshot():
+    """
+    Returns a tuple of the policy version, the active policies, the date
+    and time of the next scheduled transition and the time the snapshot
+    was loaded.
+    """
+    global _policy_snapshot
+    snapshot = _policy_snapshot
+    passed = snapshot[2] is not None and timezone.now() >= snapshot[2]
+    if passed:
+        _pass_transition(snapshot[2])
+    version = get_policy_version()
+    if passed or _is_outdated(snapshot, version):
+        snapshot = _make_snapshot(version, list(_active_policies_queryset()))
+        _policy_snapshot = snapshot
+    return snapshot
+
+
+def _is_outdated(snapshot, version):
+    """
+    Returns True if a snapshot belongs to another policy version or is
+    older than POLICY_SNAPSHOT_MAX_AGE seconds.
+
+    Keyword arguments:
+        - snapshot -- the snapshot to check
+        - version -- the current policy version
+    """
+    return version is None or snapshot[0] != version or \
+        snapshot[3] is None or time.monotonic() - snapshot[3] >= \
+        get_settings().POLICY_SNAPSHOT_MAX_AGE
+
+
+def _make_snapshot(version, policies):
+    """
+    Returns a snapshot of the policies which are active now and the date
+    and time of the next scheduled transition.
+
+    Keyword arguments:
+        - version -- the policy version
+        - policies -- list of policies with the flag active
+    """
+    now = timezone.now()
+    transitions = [
+        moment
+        for policy in policies
+        for moment in (policy.active_from, policy.active_until)
+        if moment is not None and moment > now
+    ]
+    return (version,
+            [policy for policy in policies if policy.is_active_at(now)],
+            min(transitions) if len(transitions) > 0 else None,
+            time.monotonic())
+
+
+def _pass_transition(moment):
+    """
+    Invalidates the snapshots of active policies in all processes when a
+    scheduled policy starts or ends. Only the first process which passes
+    the transition changes the policy version.
+
+    Keyword arguments:
+        - moment -- date and time of the transition
+    """
+    if get_cache().add(TRANSITION_KEY % moment.timestamp(), True, 3600):
+        bump_policy_version()
+
+
+async def _apass_transition(moment):
+    """
+    Async version of _pass_transition().
+    """
+    if await get_cache().aadd(TRANSITION_KEY % moment.timestamp(), True,
+                              3600):
+        await abump_policy_version()
+
+
+def get_policies_fingerprint():
+    """
+    Returns a fingerprint of the active policies in the current language.
+    It changes if a policy is activated, deactivated or edited. The
+    fingerprint is computed once per snapshot and language.
+    """
+    version, policies, _, loaded_at = _get_policy_snapshot()
+    key = (version, loaded_at, get_language())
+    fingerprint = _fingerprints.get(key)
+    if fingerprint is None or version is None:
+        digest = hashlib.sha1()
+        for policy in policies:
+            digest.update(('%s|%s|%s|%s|%s\n' % (
+                policy.pk, policy.published_at.isoformat(), policy.active,
+                policy.title, policy.text)).encode('utf-8'))
+        fingerprint = digest.hexdigest()
+        if len(_fingerprints) > 64:
+            _fingerprints.clear()
+        _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+async def aget_active_policies():
+    """
+    Async version of get_active_policies().
+    """
+    global _policy_snapshot
+    snapshot = _policy_snapshot
+    passed = snapshot[2] is not None and timezone.now() >= snapshot[2]
+    if passed:
+        await _apass_transition(snapshot[2])
+    version = await aget_policy_version()
+    if passed or _is_outdated(snapshot, version):
+        snapshot = _make_snapshot(version, [
+            policy async for policy in _active_policies_queryset()])
+        _policy_snapshot = snapshot
+    return list(snapshot[1])
+
+
+def _active_policies_queryset():
+    """
+    Returns a query to load the active policies from the database. The
+    schedule of the policies is not checked, so the query is independent
+    of the current time. The policies for no group come first, followed
+    by the policies of the groups ordered by the name of the group. The
+    policies of each group are ordered by date of publishing, newest
+    first.
+    """
+    return PrivacyPolicy.objects.filter(
+        active=True
+    ).select_related(
+        'for_group'
+    ).order_by(
+        F('for_group__name').asc(nulls_first=True), '-published_at'
+    )
 
 
 def get_active_policies_for_group(group=None):
@@ -76,19 +403,169 @@ def get_active_policies_for_group(group=None):
     if group is None:
         try:
             nogroup = PrivacyPolicy.objects.filter(
-                for_group=None, active=True).order_by('-published_at')
+                _scheduled_filter(), for_group=None,
+                active=True).order_by('-published_at')
             return nogroup
         except PrivacyPolicy.DoesNotExist:
             return []
     else:
         try:
             active = group.privacypolicy_set.filter(
-                active=True).order_by('-published_at')
+                _scheduled_filter(), active=True).order_by('-published_at')
             return active
         except PrivacyPolicy.DoesNotExist:
             return []
 
 
+def _scheduled_filter():
+    """
+    Returns a filter for the policies which are scheduled for now.
+    """
+    now = timezone.now()
+    return (Q(active_from=None) | Q(active_from__lte=now)) & \
+        (Q(active_until=None) | Q(active_until__gt=now))
+
+
+def in_rollout(policy, user_id):
+    """
+    Returns True if the given user is part of the rollout of the policy.
+    Every user is assigned to a stable bucket between 0 and 99, so
+    raising the percentage only adds users to the rollout.
+
+    Keyword arguments:
+        - policy -- policy object
+        - user_id -- id of the user
+    """
+    if policy.rollout_percentage >= 100:
+        return True
+    bucket = zlib.crc32(('%s:%s' % (policy.pk, user_id)).encode()) % 100
+    return bucket < policy.rollout_percentage
+
+
+def get_applicable_policies(policies, group_ids, user_id=None):
+    """
+    Returns the policies which have to be confirmed by a member of the
+    given groups.
+
+    Keyword arguments:
+        - policies -- list of active policies
+        - group_ids -- set of ids of the groups of the user
+        - user_id -- id of the user to skip policies which are not rolled
+          out to the user, the rollout is ignored if None
+    """
+    default_policy = get_settings().DEFAULT_POLICY
+    applicable = []
+    for policy in policies:
+        if user_id is not None and not in_rollout(policy, user_id):
+            continue
+        if policy.for_group_id is None:
+            if default_policy or len(group_ids) <= 0:
+                applicable.append(policy)
+        elif policy.for_group_id in group_ids:
+            applicable.append(policy)
+    return applicable
+
+
+def get_compliance(user):
+    """
+    Returns the cached compliance record of the given user or None if
+    there is no record for the current policy version.
+
+    Keyword arguments:
+        - user -- user object
+    """
+    record = get_cache().get(COMPLIANCE_KEY % user.pk)
+    if record is None or record['version'] != get_policy_version():
+        return None
+    return record
+
+
+async def aget_compliance(user):
+    """
+    Async version of get_compliance().
+    """
+    record = await get_cache().aget(COMPLIANCE_KEY % user.pk)
+    if record is None or record['version'] != await aget_policy_version():
+        return None
+    return record
+
+
+def set_compliance(user, group_ids, policy_ids):
+    """
+    Caches the compliance record of the given user.
+
+    Keyword arguments:
+        - user -- user object
+        - group_ids -- set of ids of the groups of the user
+        - policy_ids -- set of ids of the policies which are confirmed
+    """
+    record = _compliance_record(get_policy_version(), group_ids, policy_ids)
+    get_cache().set(COMPLIANCE_KEY % user.pk, record,
+                    get_settings().COMPLIANCE_CACHE_TIMEOUT)
+
+
+async def aset_compliance(user, group_ids, policy_ids):
+    """
+    Async version of set_compliance().
+    """
+    record = _compliance_record(await aget_policy_version(), group_ids,
+                                policy_ids)
+    await get_cache().aset(COMPLIANCE_KEY % user.pk, record,
+                           get_settings().COMPLIANCE_CACHE_TIMEOUT)
+
+
+def _compliance_record(version, group_ids, policy_ids):
+    """
+    Returns a compliance record to cache.
+    """
+    return {
+        'version': version,
+        'groups': sorted(group_ids),
+        'confirmed': sorted(policy_ids),
+    }
+
+
+def clear_compliance(user_id):
+    """
+    Removes the cached compliance record of a user.
+
+    Keyword arguments:
+        - user_id -- id of the user
+    """
+    get_cache().delete(COMPLIANCE_KEY % user_id)
+
+
+def is_compliant(user, policies):
+    """
+    Returns True if the cached compliance record shows that the given user
+    has confirmed all applicable policies.
+
+    Keyword arguments:
+        - user -- user object
+        - policies -- list of active policies
+    """
+    return _is_compliant(get_compliance(user), policies, user.pk)
+
+
+async def ais_compliant(user, policies):
+    """
+    Async version of is_compliant().
+    """
+    return _is_compliant(await aget_compliance(user), policies, user.pk)
+
+
+def _is_compliant(record, policies, user_id):
+    """
+    Returns True if the compliance record covers all applicable policies.
+    """
+    if record is None:
+        return False
+    confirmed = set(record['confirmed'])
+    applicable = get_applicable_policies(policies, set(record['groups']),
+                                         user_id)
+    return all(policy.id in confirmed for policy in applicable)
+
+
 def get_setting(key, default=None):
     """
     Returns a settings value.
@@ -105,28 +582,327 @@ def get_setting(key, default=None):
         return None
 
 
+def get_outstanding_confirmations(user, policies=None, group_ids=None,
+                                  with_pending=True, rollout=True):
+    """
+    Returns the applicable policies which are not confirmed by the given
+    user and the confirmations which are waiting for a second confirmation.
+    The confirmed policies are read from the compliance table of the user.
+    The confirmations are only loaded if a second confirmation is pending
+    or if the user has no compliance yet.
+
+    Keyword arguments:
+        - user -- user object
+        - policies -- list of active policies, loaded if None
+        - group_ids -- set of ids of the groups of the user, loaded if None
+        - with_pending -- False to skip loading the confirmations without
+          second confirmation
+        - rollout -- False to include policies which are not rolled out
+          to the user yet
+
+    Returns:
+        a tuple of the set of ids of unconfirmed policies and a dict
+        mapping policy ids to confirmations without second confirmation
+    """
+    if policies is None:
+        policies = get_active_policies()
+    if group_ids is None:
+        group_ids = set(user.groups.values_list('id', flat=True))
+    applicable = get_applicable_policies(policies, group_ids,
+                                         user.pk if rollout else None)
+    unconfirmed = set(policy.id for policy in applicable)
+    if len(unconfirmed) <= 0:
+        return unconfirmed, {}
+    compliance = PrivacyPolicyCompliance.objects.filter(user=user).first()
+    if compliance is not None:
+        missing, pending_ids = _split_compliance(unconfirmed, compliance)
+        if len(missing) <= 0:
+            if not with_pending or len(pending_ids) <= 0:
+                return missing, {}
+            confirmations = _confirmations_queryset(user, pending_ids)
+            return missing, _split_confirmations(pending_ids,
+                                                 confirmations)[1]
+    # the compliance may miss a confirmation saved concurrently, so the
+    # confirmations are checked before the user is asked again
+    confirmations = _confirmations_queryset(user, unconfirmed)
+    outstanding = _split_confirmations(unconfirmed, confirmations)
+    if compliance is not None and outstanding[0] != missing:
+        refresh_compliance(user.pk)
+    return outstanding
+
+
+async def aget_outstanding_confirmations(user, policies=None,
+                                         group_ids=None, with_pending=True,
+                                         rollout=True):
+    """
+    Async version of get_outstanding_confirmations().
+    """
+    if policies is None:
+        policies = await aget_active_policies()
+    if group_ids is None:
+        group_ids = set([group_id async for group_id in
+                         user.groups.values_list('id', flat=True)])
+    applicable = get_applicable_policies(policies, group_ids,
+                                         user.pk if rollout else None)
+    unconfirmed = set(policy.id for policy in applicable)
+    if len(unconfirmed) <= 0:
+        return unconfirmed, {}
+    compliance = await PrivacyPolicyCompliance.objects.filter(
+        user=user).afirst()
+    if compliance is not None:
+        missing, pending_ids = _split_compliance(unconfirmed, compliance)
+        if len(missing) <= 0:
+            if not with_pending or len(pending_ids) <= 0:
+                return missing, {}
+            confirmations = [confirmation async for confirmation in
+                             _confirmations_queryset(user, pending_ids)]
+            return missing, _split_confirmations(pending_ids,
+                                                 confirmations)[1]
+    confirmations = [confirmation async for confirmation in
+                     _confirmations_queryset(user, unconfirmed)]
+    outstanding = _split_confirmations(unconfirmed, confirmations)
+    if compliance is not None and outstanding[0] != missing:
+        await sync_to_async(refresh_compliance)(user.pk)
+    return outstanding
+
+
+def _split_compliance(policy_ids, compliance):
+    """
+    Returns the ids of the policies which are not confirmed and the ids of
+    the policies waiting for a second confirmation according to the
+    compliance of a user.
+    """
+    unconfirmed = policy_ids - set(compliance.confirmed_policies)
+    pending = (policy_ids - unconfirmed) & set(compliance.pending_policies)
+    return unconfirmed, pending
+
+
+def refresh_compliance(user_id, create=True):
+    """
+    Updates the compliance of a user from the confirmations. The row of
+    the compliance is locked before the confirmations are read, so
+    concurrent updates of the same user do not overwrite each other.
+
+    Keyword arguments:
+        - user_id -- id of the user
+        - create -- False to update an existing compliance only
+    """
+    with transaction.atomic():
+        if create:
+            PrivacyPolicyCompliance.objects.get_or_create(user_id=user_id)
+        compliance = PrivacyPolicyCompliance.objects.select_for_update(
+        ).filter(user_id=user_id).first()
+        if compliance is None:
+            return
+        confirmed = set()
+        pending = set()
+        for policy_id, second_confirmed_at in \
+                PrivacyPolicyConfirmation.objects.filter(
+                    user_id=user_id).values_list(
+                    'privacy_policy_id', 'second_confirmed_at'):
+            confirmed.add(policy_id)
+            if second_confirmed_at is None:
+                pending.add(policy_id)
+        compliance.confirmed_policies = sorted(confirmed)
+        compliance.pending_policies = sorted(pending)
+        compliance.save(update_fields=['confirmed_policies',
+                                       'pending_policies', 'updated_at'])
+
+
+def update_statistics(policy_id, confirmed=0, pending=0, create=True):
+    """
+    Changes the counters of the statistics of a policy.
+
+    Keyword arguments:
+        - policy_id -- id of the policy
+        - confirmed -- change of the number of confirmations
+        - pending -- change of the number of confirmations without second
+          confirmation
+        - create -- False to update existing statistics only
+
+    The counters are changed after the commit of the current transaction.
+    The row of a policy is shared by all its confirmations, so it is only
+    locked for a single update instead of until the end of the request.
+    """
+    if confirmed == 0 and pending == 0:
+        return
+    transaction.on_commit(
+        lambda: _update_statistics(policy_id, confirmed, pending, create))
+
+
+def _update_statistics(policy_id, confirmed, pending, create):
+    """
+    Changes the counters of the statistics of a policy at once.
+    """
+    statistics = PrivacyPolicyStatistics.objects.filter(
+        privacy_policy_id=policy_id)
+    values = {
+        'confirmed_count': F('confirmed_count') + confirmed,
+        'second_pending_count': F('second_pending_count') + pending,
+        'updated_at': timezone.now(),
+    }
+    if statistics.update(**values) > 0 or not create:
+        return
+    PrivacyPolicyStatistics.objects.get_or_create(
+        privacy_policy_id=policy_id)
+    statistics.update(**values)
+
+
+def bulk_upsert(model, objects, unique_field, update_fields):
+    """
+    Inserts the given objects at once. If a row with the same value of
+    the unique field exists, its update_fields are updated instead.
+
+    Databases which cannot name the conflicting field (e.g. MySQL) update
+    the row conflicting in any unique field. Databases without support
+    for conflicts (e.g. Oracle) update the existing rows one by one and
+    insert the others.
+
+    Keyword arguments:
+        - model -- the model class
+        - objects -- list of unsaved objects
+        - unique_field -- name of the unique field
+        - update_fields -- names of the fields to update
+    """
+    using = router.db_for_write(model)
+    features = connections[using].features
+    manager = model.objects.using(using)
+    if features.supports_update_conflicts_with_target:
+        manager.bulk_create(objects, update_conflicts=True,
+                            unique_fields=[unique_field],
+                            update_fields=update_fields)
+    elif features.supports_update_conflicts:
+        manager.bulk_create(objects, update_conflicts=True,
+                            update_fields=update_fields)
+    else:
+        fields = [model._meta.get_field(name) for name in update_fields]
+        attname = model._meta.get_field(unique_field).attname
+        with transaction.atomic(using=using):
+            missing = [
+                obj for obj in objects
+                if manager.filter(**{
+                    attname: getattr(obj, attname)
+                }).update(**{
+                    field.name: field.pre_save(obj, False) for field in fields
+                }) <= 0
+            ]
+            manager.bulk_create(missing)
+
+
+def _confirmations_queryset(user, policy_ids):
+    """
+    Returns a query to load the confirmations of a user to the given
+    policies. The oldest confirmation of a policy comes last.
+    """
+    return PrivacyPolicyConfirmation.objects.filter(
+        user=user, privacy_policy_id__in=policy_ids).order_by('-id')
+
+
+def _split_confirmations(policy_ids, confirmations):
+    """
+    Returns the ids of the policies which are not confirmed and a dict of
+    confirmations without second confirmation.
+    """
+    confirmed = {}
+    for confirmation in confirmations:
+        confirmed[confirmation.privacy_policy_id] = confirmation
+    pending = {
+        policy_id: confirmation
+        for policy_id, confirmation in confirmed.items()
+        if confirmation.second_confirmed_at is None
+    }
+    return policy_ids - set(confirmed), pending
+
+
+def confirm_policy(user, policy):
+    """
+    Saves the confirmation of a user to a policy. If the policy is
+    already confirmed, e.g. by a concurrent request, the existing
+    confirmation is returned.
+
+    Keyword arguments:
+        - user -- user object
+        - policy -- the confirmed policy
+
+    Returns:
+        a tuple of the confirmation and True if it was created
+    """
+    return PrivacyPolicyConfirmation.objects.get_or_create(
+        user=user, privacy_policy=policy,
+        defaults={'confirmed_at': timezone.now()})
+
+
 def save_confirmation(user):
     """
     Saves a confirmation to policies according to the given user.
+    The existing confirmations are checked using a single query and the
+    missing ones are inserted at once. Confirmations inserted by
+    concurrent requests are skipped.
 
     Keyword arguments:
         - user -- user object
+
+    Returns:
+        the list of confirmations to the policies which were not
+        confirmed before
     """
     policies = get_active_policies()
     if len(policies) <= 0:
         raise Http404
-    for policy in policies:
-        if get_setting('DEFAULT_POLICY', True):
-            no = policy.for_group is None
-        else:
-            no = policy.for_group is None \
-                and len(user.groups.all()) <= 0
-        if policy.for_group in user.groups.all() or no:
-            confirms = PrivacyPolicyConfirmation.objects.filter(
-                privacy_policy=policy, user=user)
-            if len(confirms) <= 0:
-                confirmation = PrivacyPolicyConfirmation(
-                    user=user,
-                    confirmed_at=timezone.now(),
-                    privacy_policy=policy)
-                confirmation.save()
+    unconfirmed, _ = get_outstanding_confirmations(
+        user, policies, with_pending=False, rollout=False)
+    now = timezone.now()
+    confirmations = [
+        PrivacyPolicyConfirmation(
+            user=user,
+            confirmed_at=now,
+            privacy_policy=policy)
+        for policy in policies if policy.id in unconfirmed
+    ]
+    if len(confirmations) <= 0:
+        return []
+    policy_ids = [c.privacy_policy_id for c in confirmations]
+    with transaction.atomic():
+        PrivacyPolicyConfirmation.objects.bulk_create(
+            confirmations, ignore_conflicts=True)
+        saved = {
+            confirmation.privacy_policy_id: confirmation
+            for confirmation in PrivacyPolicyConfirmation.objects.filter(
+                user=user, privacy_policy_id__in=policy_ids)
+        }
+        refresh_compliance(user.pk)
+        for policy_id in policy_ids:
+            # rows of concurrent requests were counted by their request
+            if saved[policy_id].confirmed_at == now:
+                update_statistics(policy_id, confirmed=1, pending=1)
+    transaction.on_commit(lambda: clear_compliance(user.pk))
+    return [saved[policy_id] for policy_id in policy_ids]
+
+
+class RateLimiter(object):
+    """
+    Limits the number of operations per second by sleeping before an
+    operation would exceed the rate.
+    """
+
+    def __init__(self, rate=None):
+        """
+        constructor: sets the rate
+
+        Keyword arguments:
+            - rate -- operations per second, unlimited if None
+        """
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        """
+        Waits until the next operation is allowed.
+        """
+        if self.interval <= 0:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
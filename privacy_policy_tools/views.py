@@ -22,29 +22,89 @@
 """
 This module provides the views of the privacy_policy_tools.
 """
+from functools import wraps
 from smtplib import SMTPException
 
 from django.contrib import messages
 from django.contrib.auth import logout
-from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.http import HttpResponseRedirect, Http404
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required, \
+    permission_required
+from django.http import HttpResponseRedirect, Http404, \
+    StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.translation import gettext_lazy as _
-from django.template.loader import render_to_string
+from django.views.decorators.http import condition
 from django.urls import reverse
 from django.utils import timezone
 
 from privacy_policy_tools.models import PrivacyPolicy, \
-    PrivacyPolicyConfirmation, OneTimeToken
-from privacy_policy_tools.utils import get_active_policies, get_setting, \
-    get_by_py_path
+    PrivacyPolicyConfirmation
+from privacy_policy_tools.conf import get_settings
+from privacy_policy_tools.export import FORMATS, export_confirmations
+from privacy_policy_tools.utils import get_active_policies, get_hook, \
+    confirm_policy, get_policies_fingerprint
 from privacy_policy_tools.forms import ConfirmForm, SecondConfirmGetEmail
+from privacy_policy_tools.mail import send_second_confirm_mail
+from privacy_policy_tools.tokens import create_token, check_token, \
+    delete_token
 
 
+def _show_last_modified(request):
+    """
+    Returns the date of publishing of the newest active policy. Scheduled
+    policies are published when they become active.
+
+    Keyword arguments:
+        - request -- the calling HttpRequest
+    """
+    policies = get_active_policies()
+    if len(policies) <= 0:
+        return None
+    return max(max(policy.published_at,
+                   policy.active_from or policy.published_at)
+               for policy in policies)
+
+
+def _show_etag(request):
+    """
+    Returns the ETag of the policy page. It is the fingerprint of the
+    active policies in the current language.
+
+    Keyword arguments:
+        - request -- the calling HttpRequest
+    """
+    return get_policies_fingerprint()
+
+
+def _cache_headers(view):
+    """
+    Adds the Cache-Control and Vary headers configured for the policy page
+    to all responses of a view, including 304 Not Modified.
+
+    Keyword arguments:
+        - view -- view to decorate
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        app_settings = get_settings()
+        if app_settings.POLICY_PAGE_CACHE_CONTROL:
+            patch_cache_control(response,
+                                **app_settings.POLICY_PAGE_CACHE_CONTROL)
+        if app_settings.POLICY_PAGE_VARY:
+            patch_vary_headers(response, app_settings.POLICY_PAGE_VARY)
+        return response
+    return wrapper
+
+
+@_cache_headers
+@condition(etag_func=_show_etag, last_modified_func=_show_last_modified)
 def show(request):
     """
-    Displays the Privacy Policies.
+    Displays the Privacy Policies. Clients can revalidate the page using
+    the ETag and Last-Modified headers.
 
     Keyword arguments:
         - request -- the calling HttpRequest
@@ -60,6 +120,36 @@ def show(request):
         request, 'privacy_policy_tools/show.html', params)
 
 
+@staff_member_required
+@permission_required('privacy_policy_tools.view_privacypolicyconfirmation',
+                     raise_exception=True)
+def export(request):
+    """
+    Streams all confirmations for audits. Only available for staff members.
+
+    GET parameters:
+        - format -- csv (default) or jsonl
+        - gzip -- 1 to compress the export with gzip
+
+    Keyword arguments:
+        - request -- the calling HttpRequest
+    """
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        raise Http404
+    compress = request.GET.get('gzip') == '1'
+    filename = 'confirmations.' + format
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(
+        export_confirmations(format, compress),
+        content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+
 def confirm(request, policy_id, next='/terms/and/conditions'):
     """
     Displays the Privacy Policy and asks for confirmation.
@@ -77,9 +167,8 @@ def confirm(request, policy_id, next='/terms/and/conditions'):
 
     is_confirmed = False
     if request.user.is_authenticated:
-        confirmations = PrivacyPolicyConfirmation.objects.filter(
-            privacy_policy=policy, user=request.user)
-        if len(confirmations) > 0:
+        if PrivacyPolicyConfirmation.objects.filter(
+                privacy_policy=policy, user=request.user).exists():
             is_confirmed = True
         else:
             url = reverse('privacy_policy_tools.views.confirm',
@@ -92,18 +181,10 @@ def confirm(request, policy_id, next='/terms/and/conditions'):
                 request.POST,
                 agree_label=policy.confirm_checkbox_text)
             if form.is_valid():
-                confirmation = PrivacyPolicyConfirmation(
-                    user=request.user,
-                    confirmed_at=timezone.now(),
-                    privacy_policy=policy)
-                confirmation.save()
+                confirm_policy(request.user, policy)
                 return HttpResponseRedirect(next)
         else:
-            confirmation = PrivacyPolicyConfirmation(
-                user=request.user,
-                confirmed_at=timezone.now(),
-                privacy_policy=policy)
-            confirmation.save()
+            confirm_policy(request.user, policy)
             return HttpResponseRedirect(next)
     else:
         if policy.confirm_checkbox is True:
@@ -137,12 +218,10 @@ def second_confirm_required(request, confirm_id):
                                      id=confirm_id)
     if confirmation.second_confirmed_at is not None:
         raise Http404
-    get_hook = get_setting(
-        'SECOND_CONFIRMATION_GET_EMAIL_HOOK', None)
+    get_email_hook = get_hook('SECOND_CONFIRMATION_GET_EMAIL_HOOK')
 
-    if get_hook is not None:
-        get_hook = get_by_py_path(get_hook)
-        parent_email = get_hook(request)
+    if get_email_hook is not None:
+        parent_email = get_email_hook(request)
     else:
         raise Http404
 
@@ -152,38 +231,19 @@ def second_confirm_required(request, confirm_id):
         form = SecondConfirmGetEmail(request.POST)
         if form.is_valid():
             email = form.cleaned_data['email']
-            save_hook = get_setting(
-                'SECOND_CONFIRMATION_SAVE_EMAIL_HOOK', None)
+            save_hook = get_hook('SECOND_CONFIRMATION_SAVE_EMAIL_HOOK')
 
             if save_hook is not None:
-                save_hook = get_by_py_path(save_hook)
                 save_hook(request, email)
             else:
                 raise Http404
-            token = OneTimeToken.create_token(confirmation)
+            token = create_token(confirmation)
             confirm_url = reverse('privacy_policy_tools.views'
                                   '.second_confirm',
                                   args=(confirmation.id, token))
             confirm_url = request.build_absolute_uri(confirm_url)
-            context = {
-                'confirm_url': confirm_url,
-            }
-            subject = render_to_string(
-                'privacy_policy_tools/second_confirm_mail_subject.txt',
-                {})
-            message = render_to_string(
-                'privacy_policy_tools/second_confirm_mail.txt',
-                context, request)
-            from_email = get_setting('SECOND_CONFIRM_FROM_EMAIL',
-                                     'no-reply@example.com')
             try:
-                send_mail(
-                    subject,
-                    message,
-                    from_email,
-                    [email],
-                    fail_silently=False,
-                )
+                send_second_confirm_mail(email, confirm_url)
                 messages.info(request, _('The E-mail was sent to request the '
                                          'confirmation.'))
             except SMTPException:
@@ -226,24 +286,7 @@ def second_confirm(request, confirm_id, token):
     """
     confirmation = get_object_or_404(PrivacyPolicyConfirmation,
                                      id=confirm_id)
-    if confirmation.second_confirmed_at is not None:
-        return render(
-            request,
-            'privacy_policy_tools/second_confirm_invalid.html', {})
-    tokens = OneTimeToken.objects.filter(
-        confirmation=confirmation,
-        token=token
-    )
-    if len(tokens) != 1:
-        return render(
-            request,
-            'privacy_policy_tools/second_confirm_invalid.html', {})
-    token = tokens.first()
-    valid_for = get_setting('SECOND_CONFIRM_VALID_FOR_MINUTES', 10)
-    now = timezone.now()
-    delta = now - token.created_at
-    delta_minutes = int(delta.total_seconds() / 60)
-    if delta_minutes > valid_for:
+    if not check_token(confirmation, token):
         return render(
             request,
             'privacy_policy_tools/second_confirm_invalid.html', {})
@@ -256,7 +299,7 @@ def second_confirm(request, confirm_id, token):
         if form.is_valid():
             confirmation.second_confirmed_at = timezone.now()
             confirmation.save()
-            token.delete()
+            delete_token(confirmation, token)
             messages.info(request, _('You have successfully agreed to the '
                                      'privacy policy.'))
             return HttpResponseRedirect('/')